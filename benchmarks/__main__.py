@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks import generators
+from benchmarks import suite
+from benchmarks.suite import Result
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        prog="benchmarks", description="Benchmark Scry on generated programs."
+    )
+    arg_parser.add_argument(
+        "--workloads",
+        nargs="+",
+        choices=tuple(generators.GENERATORS),
+        default=tuple(generators.GENERATORS),
+        help="the kinds of program to generate (default: all)",
+    )
+    arg_parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=suite.DEFAULT_SIZES,
+        help="program sizes in lines, up to 1000000 (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=suite.STAGES,
+        default=suite.STAGES,
+        help="what to time (default: all)",
+    )
+    arg_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=suite.DEFAULT_REPEAT,
+        help="keep the best of this many timings (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--output", type=Path, default=None, help="write the results as json"
+    )
+    arg_parser.add_argument(
+        "--compare",
+        type=Path,
+        default=None,
+        metavar="BASELINE",
+        help="fail if the results regressed against a stored baseline",
+    )
+    arg_parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help=f"store the results as the new baseline ({BASELINE.name})",
+    )
+    arg_parser.add_argument(
+        "--time-tolerance",
+        type=float,
+        default=suite.TIME_TOLERANCE,
+        help="allowed slowdown before failing (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--memory-tolerance",
+        type=float,
+        default=suite.MEMORY_TOLERANCE,
+        help="allowed peak memory growth before failing (default: %(default)s)",
+    )
+    return arg_parser.parse_args()
+
+
+def report(key: str, result: Result) -> None:
+    peak = "-" if result.peak_bytes is None else f"{result.peak_bytes / 2**20:.1f}"
+    print(
+        f"{key:<32} {result.seconds:>9.4f}s {result.lines_per_s:>12,.0f} lines/s "
+        f"{result.ops_per_s:>12,.0f} ops/s {peak:>8} MiB",
+        flush=True,
+    )
+
+
+def main() -> int:
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = suite.run(
+            Path(directory),
+            args.workloads,
+            args.sizes,
+            args.stages,
+            args.repeat,
+            report,
+        )
+
+    data = json.dumps(results, indent=2) + "\n"
+
+    if args.output is not None:
+        args.output.write_text(data)
+
+    if args.save_baseline:
+        BASELINE.write_text(data)
+
+    if args.compare is None:
+        return 0
+
+    baseline = json.loads(args.compare.read_text())
+    regressions = suite.compare(
+        results, baseline, args.time_tolerance, args.memory_tolerance
+    )
+
+    if baseline["environment"] != results["environment"]:
+        print(f"\nBaseline was recorded on {baseline['environment']}")
+
+    if not regressions:
+        print("\nNo regressions against the baseline")
+        return 0
+
+    print("\nRegressions against the baseline:")
+
+    for regression in regressions:
+        print(f"  {regression}")
+
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import random
+import typing as t
+from pathlib import Path
+
+Generator = t.Callable[[int, random.Random], t.Iterator[str]]
+
+WORDS = ("scry", "vision", "stack", "crystal", "orb", "future", "rune", "seer")
+OPS = ("add", "sub", "mul")
+
+
+def arithmetic(lines: int, rng: random.Random) -> t.Iterator[str]:
+    # Every chain starts from a variable so nothing can be folded away
+    yield "var int x"
+    yield f"move x {rng.randint(1, 100)}"
+
+    for _ in range(max(0, lines - 3) // 8):
+        yield "push x"
+
+        for _ in range(3):
+            yield f"push int {rng.randint(1, 1000)}"
+            yield rng.choice(OPS)
+
+        yield "pop drop"
+
+    yield "drop x"
+
+
+def interpolation(lines: int, rng: random.Random) -> t.Iterator[str]:
+    yield "var string name"
+    yield f'move name "{rng.choice(WORDS)}"'
+    yield "var int count"
+    yield f"move count {rng.randint(1, 1000)}"
+    yield "var string message"
+
+    for _ in range(max(0, lines - 8) // 3):
+        word = rng.choice(WORDS)
+        yield f'push string "The {word} of ${{name}} shows ${{count}} paths"'
+        yield "pop drop"
+        yield f'move message "${{name}} sees ${{count}} {word}s"'
+
+    yield "drop message"
+    yield "drop count"
+    yield "drop name"
+
+
+def variables(lines: int, rng: random.Random) -> t.Iterator[str]:
+    # Variables are kept alive in batches, so many are defined at once
+    batch: list[str] = []
+
+    for i in range(max(0, lines) // 5):
+        name = f"v{i}"
+        batch.append(name)
+        yield f"var int {name}"
+        yield f"move {name} {rng.randint(0, 10_000)}"
+        yield f"push {name}"
+        yield f"pop {name}"
+
+        if len(batch) == 1000:
+            yield from (f"drop {name}" for name in batch)
+            batch.clear()
+
+    yield from (f"drop {name}" for name in batch)
+
+
+def printing(lines: int, rng: random.Random) -> t.Iterator[str]:
+    yield "var string name"
+    yield f'move name "{rng.choice(WORDS)}"'
+
+    for _ in range(max(0, lines - 3) // 7):
+        yield f"push int {rng.randint(0, 1_000_000)}"
+        yield "print"
+        yield f'push string "{rng.choice(WORDS)} for ${{name}}"'
+        yield "print"
+        yield "print name"
+        yield f"push float {rng.random():.6f}"
+        yield "print"
+
+    yield "drop name"
+
+
+GENERATORS: dict[str, Generator] = {
+    "arithmetic": arithmetic,
+    "interpolation": interpolation,
+    "variables": variables,
+    "printing": printing,
+}
+
+
+def generate(name: str, lines: int, path: Path, seed: int = 0) -> int:
+    rng = random.Random(f"{name}-{lines}-{seed}")
+    written = 0
+
+    with open(path, "w") as f:
+        for line in GENERATORS[name](lines, rng):
+            f.write(line + "\n")
+            written += 1
+
+    return written
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import typing as t
+from dataclasses import asdict
+from dataclasses import dataclass
+from pathlib import Path
+
+import scry
+from benchmarks import generators
+from scry import pipeline
+from scry.lexer import Lexer
+from scry.output import BufferedSink
+from scry.output import FlushPolicy
+from scry.parser import Parser
+from scry.program import Program
+from scry.vm import VM
+
+ROOT = Path(__file__).resolve().parent.parent
+STAGES = ("lex", "parse", "compile", "run", "e2e")
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_REPEAT = 3
+
+# Measurements smaller than these are too noisy to flag as regressions
+MIN_SECONDS = 0.01
+MIN_PEAK_BYTES = 64 * 1024
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.10
+
+Thunk = t.Callable[[], t.Any]
+
+
+@dataclass
+class Result:
+    seconds: float
+    lines_per_s: float
+    ops_per_s: float
+    peak_bytes: int | None
+
+
+class Case:
+    def __init__(self, workload: str, lines: int, path: Path) -> None:
+        self.workload = workload
+        self.size = lines
+        self.path = path
+        self.lines = generators.generate(workload, lines, path)
+
+        lexer = Lexer(path)
+        lexer.lex()
+        self.tokens = lexer.tokens
+        self.instructions = len(self.program())
+
+    def program(self) -> Program:
+        return pipeline.build(self.tokens)
+
+    def key(self, stage: str) -> str:
+        return f"{self.workload}/{self.size}/{stage}"
+
+
+def devnull_sink() -> BufferedSink:
+    return BufferedSink(open(os.devnull, "w"), FlushPolicy())
+
+
+def peak_rss() -> int | None:
+    # The high water mark of this process since it started
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # Linux reports kilobytes, macOS reports bytes
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+# Runs scry as `python -m scry` would, then reports its peak memory. The
+# rusage a parent gets for its child still includes the memory of the
+# process it was forked from, so the child has to measure itself.
+PROBE = """
+import runpy
+import sys
+
+try:
+    runpy.run_module("scry", run_name="__main__", alter_sys=True)
+finally:
+    from benchmarks.suite import peak_rss
+
+    sys.stderr.write(f"\\npeak={peak_rss()}\\n")
+"""
+
+
+def run_python(path: Path) -> int | None:
+    command = [sys.executable, "-c", PROBE, "--no-cache", str(path)]
+    result = subprocess.run(
+        command,
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+
+    peak = result.stderr.rstrip().rpartition("peak=")[2]
+    return None if peak == "None" else int(peak)
+
+
+def prepare(stage: str, case: Case) -> tuple[Thunk, int]:
+    # The work to time, and how many ops it processes. Anything built
+    # here is excluded from the measurement.
+    if stage == "lex":
+        return Lexer(case.path).lex, len(case.tokens)
+
+    if stage == "parse":
+        parser = Parser(devnull_sink())
+        return lambda: parser.parse(case.tokens), len(case.tokens)
+
+    if stage == "compile":
+        return case.program, case.instructions
+
+    if stage == "run":
+        vm = VM(devnull_sink())
+        program = case.program()
+        return lambda: vm.run(program), case.instructions
+
+    if stage == "e2e":
+        return lambda: run_python(case.path), case.lines
+
+    raise ValueError(f"Unknown stage {stage!r}")
+
+
+def measure(stage: str, case: Case, repeat: int = DEFAULT_REPEAT) -> Result:
+    best = float("inf")
+
+    for _ in range(repeat):
+        thunk, ops = prepare(stage, case)
+        start = time.perf_counter()
+        rss = thunk()
+        best = min(best, time.perf_counter() - start)
+
+    if stage == "e2e":
+        # The child reports its own peak, tracing it here would miss it
+        peak = rss
+    else:
+        thunk, _ = prepare(stage, case)
+        tracemalloc.start()
+
+        try:
+            thunk()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return Result(best, case.lines / best, ops / best, peak)
+
+
+def environment() -> dict[str, str]:
+    return {
+        "scry": scry.__version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+    }
+
+
+def run(
+    directory: Path,
+    workloads: t.Iterable[str],
+    sizes: t.Iterable[int],
+    stages: t.Iterable[str],
+    repeat: int = DEFAULT_REPEAT,
+    report: t.Callable[[str, Result], None] | None = None,
+) -> dict[str, t.Any]:
+    results: dict[str, t.Any] = {}
+    stages = tuple(stages)
+
+    for workload in workloads:
+        for size in sizes:
+            case = Case(workload, size, directory / f"{workload}-{size}.scry")
+
+            for stage in stages:
+                result = measure(stage, case, repeat)
+                results[case.key(stage)] = asdict(result)
+
+                if report is not None:
+                    report(case.key(stage), result)
+
+            case.path.unlink()
+
+    return {"environment": environment(), "results": results}
+
+
+def compare(
+    current: dict[str, t.Any],
+    baseline: dict[str, t.Any],
+    time_tolerance: float = TIME_TOLERANCE,
+    memory_tolerance: float = MEMORY_TOLERANCE,
+) -> list[str]:
+    regressions: list[str] = []
+
+    for key, before in baseline["results"].items():
+        after = current["results"].get(key)
+
+        if after is None:
+            continue
+
+        seconds = before["seconds"]
+        if seconds >= MIN_SECONDS and after["seconds"] > seconds * (1 + time_tolerance):
+            regressions.append(
+                f"{key}: {seconds:.4f}s -> {after['seconds']:.4f}s "
+                f"({after['seconds'] / seconds - 1:+.0%})"
+            )
+
+        peak = before["peak_bytes"]
+
+        if (
+            peak is not None
+            and peak >= MIN_PEAK_BYTES
+            and (after["peak_bytes"] or 0) > peak * (1 + memory_tolerance)
+        ):
+            regressions.append(
+                f"{key}: peak {peak:,} -> {after['peak_bytes']:,} bytes "
+                f"({after['peak_bytes'] / peak - 1:+.0%})"
+            )
+
+    return regressions
@@ -65,6 +65,12 @@ def imports(session: nox.Session) -> None:
     )
 
 
+@nox.session(reuse_venv=True)
+@install("pytest")
+def tests(session: nox.Session) -> None:
+    session.run("pytest", "tests")
+
+
 @nox.session(reuse_venv=True)
 def version_check(session: nox.Session) -> None:
     toml_version = None
@@ -86,3 +92,16 @@ def version_check(session: nox.Session) -> None:
 
     if toml_version != init_version:
         session.error(f"pyproject v{toml_version} does not match init v{init_version}")
+
+
+@nox.session(reuse_venv=True)
+def benchmarks(session: nox.Session) -> None:
+    # Extra arguments are passed through, e.g. --sizes 1000 1000000
+    session.run(
+        "python",
+        "-m",
+        "benchmarks",
+        "--compare",
+        "benchmarks/baseline.json",
+        *session.posargs,
+    )
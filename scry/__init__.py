@@ -1,4 +1,24 @@
 from __future__ import annotations
 
+import typing as t
+
+from scry.interpreter import Interpreter
+from scry.interpreter import ScriptResult
+
+if t.TYPE_CHECKING:
+    from scry.batch import run_many
+
 __version__ = "0.1.0"
 __author__ = "Jonxslays"
+
+__all__ = ("Interpreter", "ScriptResult", "run_many")
+
+
+def __getattr__(name: str) -> t.Any:
+    # The batch module loads the process pool, which only batches need
+    if name == "run_many":
+        from scry.batch import run_many
+
+        return run_many
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,28 +1,320 @@
+from __future__ import annotations
+
+import argparse
 import sys
+import time
+import typing as t
+from pathlib import Path
 
+from scry import cache
+from scry import incremental
 from scry.errors import ScryExc
-from scry.lexer import Lexer
-from scry.parser import Parser
+from scry.interpreter import ENGINES
+from scry.interpreter import Interpreter
+from scry.interpreter import ScriptResult
+from scry.limits import Limits
+from scry.output import DEFAULT_FLUSH_BYTES
+from scry.output import BufferedSink
+from scry.output import FlushPolicy
+from scry.profiler import FORMATS
+from scry.profiler import Profile
 
 
-def main() -> None:
-    if sys.argv[1:]:
-        file = sys.argv[1]
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(prog="scry", description="Run Scry programs.")
+    arg_parser.add_argument(
+        "files",
+        nargs="+",
+        metavar="file",
+        help="the path to the Scry program to run, or several to run as a batch",
+    )
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="how many processes run a batch (default: one per cpu)",
+    )
+    arg_parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="vm",
+        help="the execution engine to use (default: vm)",
+    )
+    arg_parser.add_argument(
+        "--no-optimize",
+        action="store_true",
+        help="skip constant folding and peephole optimization",
+    )
+    arg_parser.add_argument(
+        "--no-verify",
+        action="store_true",
+        help="skip static verification and check every instruction at runtime",
+    )
+    arg_parser.add_argument(
+        "--auto-drop",
+        action="store_true",
+        help="release every variable right after its last use",
+    )
+    arg_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="lex, compile and run the program incrementally as it is read",
+    )
+    arg_parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="run the program again every time it is saved, recompiling"
+        " only the lines that changed",
+    )
+    arg_parser.add_argument(
+        "--lex-jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="lex large programs in N processes (0 for one per cpu, default: 1)",
+    )
+    arg_parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="memory map the program instead of reading it as text",
+    )
+    arg_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="do not read or write the compiled program cache",
+    )
+    arg_parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help=f"where to store compiled programs (default: {cache.CACHE_DIR}"
+        " next to the program)",
+    )
+    arg_parser.add_argument(
+        "--flush-lines",
+        type=int,
+        default=None,
+        metavar="N",
+        help="flush output after every N printed lines (0 to disable)",
+    )
+    arg_parser.add_argument(
+        "--flush-bytes",
+        type=int,
+        default=None,
+        metavar="N",
+        help="flush output once N characters are buffered (0 to only flush on"
+        f" exit, default: {DEFAULT_FLUSH_BYTES})",
+    )
+    arg_parser.add_argument(
+        "--max-instructions",
+        type=int,
+        default=None,
+        metavar="N",
+        help="stop programs after N instructions",
+    )
+    arg_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="stop programs that run for longer than this",
+    )
+    arg_parser.add_argument(
+        "--max-stack",
+        type=int,
+        default=None,
+        metavar="N",
+        help="stop programs that put more than N values on the stack",
+    )
+    arg_parser.add_argument(
+        "--max-int-bits",
+        type=int,
+        default=None,
+        metavar="N",
+        help="stop programs before they compute an int of more than N bits",
+    )
+    arg_parser.add_argument(
+        "--max-string-length",
+        type=int,
+        default=None,
+        metavar="N",
+        help="stop programs before they build a string of more than N characters",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="count and time every op and line, then report where time went",
+    )
+    arg_parser.add_argument(
+        "--profile-format",
+        choices=FORMATS,
+        default="report",
+        help="report is a sorted table, collapsed feeds flame graph tools"
+        " (default: report)",
+    )
+    arg_parser.add_argument(
+        "--profile-output",
+        type=Path,
+        default=None,
+        help="where to write the profile (default: stderr)",
+    )
+
+    args = arg_parser.parse_intermixed_args()
+
+    if args.stream and args.engine != "vm":
+        arg_parser.error("--stream requires the vm engine")
+
+    if args.auto_drop and (args.stream or args.engine == "parser"):
+        arg_parser.error("--auto-drop can not be used with --stream or the parser")
+
+    args.batch = len(args.files) > 1 or args.jobs is not None
+    args.file = args.files[0]
+
+    if args.batch and (args.stream or args.profile or args.watch):
+        arg_parser.error("--stream, --profile and --watch only run a single program")
+
+    if args.lex_jobs != 1 and (args.batch or args.stream):
+        arg_parser.error("--lex-jobs can not be used in a batch or with --stream")
+
+    args.limits = limits(args)
+
+    if args.limits is not None and (args.profile or args.engine == "parser"):
+        arg_parser.error("limits require the vm or py engine without --profile")
+
+    if args.watch and (args.stream or args.profile or args.engine != "vm"):
+        arg_parser.error("--watch requires the vm engine without --stream or --profile")
+
+    return args
+
+
+def limits(args: argparse.Namespace) -> Limits | None:
+    limits = Limits(
+        args.max_instructions,
+        args.timeout,
+        args.max_stack,
+        args.max_int_bits,
+        args.max_string_length,
+    )
+
+    return None if limits == Limits() else limits
+
+
+def flush_policy(args: argparse.Namespace) -> FlushPolicy | None:
+    if args.flush_lines is None and args.flush_bytes is None:
+        # Line buffered on a terminal, block buffered otherwise
+        return None
+
+    max_bytes = DEFAULT_FLUSH_BYTES if args.flush_bytes is None else args.flush_bytes
+    return FlushPolicy(max_bytes or None, args.flush_lines or None)
+
+
+def write_profile(args: argparse.Namespace, profile: Profile) -> None:
+    data = profile.render(args.profile_format)
+
+    if args.profile_output is None:
+        sys.stderr.write(data)
     else:
-        raise Exception("You must pass a filepath to run.")
+        args.profile_output.write_text(data)
+
 
-    lexer = Lexer(file)
-    lexer.lex()
+def interpreter_options(args: argparse.Namespace) -> dict[str, t.Any]:
+    return {
+        "engine": args.engine,
+        "optimize": not args.no_optimize,
+        "verify": not args.no_verify,
+        "use_cache": not args.no_cache,
+        "cache_dir": args.cache_dir,
+        "use_mmap": args.mmap,
+        "limits": args.limits,
+        "auto_drop": args.auto_drop,
+    }
 
-    parser = Parser()
-    parser.parse(lexer.tokens)
+
+def run_batch(args: argparse.Namespace) -> int:
+    # Imported here so running one script does not load the process pool
+    from scry import batch
+
+    results = batch.iter_many(args.files, args.jobs, **interpreter_options(args))
+    start = time.perf_counter()
+    count = failed = 0
+
+    for result in results:
+        status = "ok" if result.ok else f"ERROR: {result.error}"
+        sys.stdout.write(f"==> {result.file} <==\n{result.output}")
+        sys.stdout.write(f"<== {status} ({result.seconds * 1000:.3f} ms)\n")
+        count += 1
+        failed += not result.ok
+
+    sys.stdout.flush()
+    sys.stderr.write(
+        f"{count} scripts, {failed} failed in {time.perf_counter() - start:.3f} s\n"
+    )
+    return 1 if failed else 0
+
+
+def report_watch(
+    result: ScriptResult, compiler: incremental.IncrementalCompiler
+) -> None:
+    status = "ok" if result.ok else f"ERROR: {str(result.error).rstrip()}"
+    sys.stderr.write(
+        f"<== {status} ({result.seconds * 1000:.3f} ms,"
+        f" {len(compiler.changed)} lines recompiled)\n"
+    )
+
+
+def main() -> None:
+    if sys.argv[1:2] == ["serve"]:
+        # Imported here so running a script does not load asyncio and
+        # multiprocessing
+        from scry import server
+
+        return server.main(sys.argv[2:])
+
+    args = parse_args()
+
+    if args.batch:
+        sys.exit(run_batch(args))
+
+    output = BufferedSink(policy=flush_policy(args))
+
+    if args.watch:
+        interpreter = Interpreter(**interpreter_options(args))
+
+        try:
+            return incremental.watch(args.file, interpreter, output, report_watch)
+        except KeyboardInterrupt:
+            return None
+
+    profile = Profile(args.file) if args.profile else None
+    interpreter = Interpreter(
+        stream=args.stream,
+        profile=profile,
+        lex_jobs=args.lex_jobs,
+        **interpreter_options(args),
+    )
+
+    try:
+        result = interpreter.run(args.file, output)
+    finally:
+        if profile is not None:
+            write_profile(args, profile)
+
+    result.check()
 
 
 if __name__ == "__main__":
     try:
         main()
     except ScryExc as e:
-        sys.stderr.write(f"ERROR: {e}")
+        message = str(e)
+        sys.stderr.write(f"ERROR: {message}")
+
+        if e.excerpt is not None:
+            # Lexer errors end with the newline of the line they quote
+            separator = "" if message.endswith("\n") else "\n"
+            sys.stderr.write(f"{separator}{e.excerpt}")
+
         sys.exit(1)
     except Exception as e:
         raise
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import functools
+import os
+import typing as t
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from scry.interpreter import Interpreter
+from scry.interpreter import ScriptResult
+
+# Scripts are handed to workers in chunks of up to this many, so short
+# scripts are not dominated by the cost of sending them to a process
+MAX_CHUNK_SIZE = 64
+
+
+@functools.lru_cache(maxsize=None)
+def worker_interpreter(**options: t.Any) -> Interpreter:
+    # Every worker keeps one interpreter per set of options, so scripts
+    # it runs later reuse its warm caches
+    return Interpreter(**options)
+
+
+def run_script(file: str | Path, **options: t.Any) -> ScriptResult:
+    try:
+        return worker_interpreter(**options).run(file)
+    except Exception as e:
+        # A bug in one script, like dividing by zero, must not take the
+        # rest of the batch down with it
+        return ScriptResult(str(file), "", f"{type(e).__name__}: {e}", 0.0)
+
+
+def iter_many(
+    files: t.Iterable[str | Path], jobs: int | None = None, **options: t.Any
+) -> t.Iterator[ScriptResult]:
+    files = list(files)
+    jobs = jobs or os.cpu_count() or 1
+    run = functools.partial(run_script, **options)
+
+    if jobs == 1 or len(files) < 2:
+        yield from map(run, files)
+        return None
+
+    chunk_size = max(1, min(MAX_CHUNK_SIZE, len(files) // (jobs * 4)))
+
+    with ProcessPoolExecutor(min(jobs, len(files))) as pool:
+        # Results come back in the order the files were given
+        yield from pool.map(run, files, chunksize=chunk_size)
+
+
+def run_many(
+    files: t.Iterable[str | Path], jobs: int | None = None, **options: t.Any
+) -> list[ScriptResult]:
+    return list(iter_many(files, jobs, **options))
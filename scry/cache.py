@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import hashlib
+import marshal
+import os
+import typing as t
+from pathlib import Path
+
+import scry
+from scry import pipeline
+from scry import templates
+from scry.lexer import Lexer
+from scry.positions import LineTable
+from scry.program import SPECIALIZED
+from scry.program import Instruction
+from scry.program import OpCode
+from scry.program import Program
+
+MAGIC = b"SCRYC"
+# Bumped whenever the layout of the payload changes
+FORMAT = 2
+CACHE_DIR = "__scrycache__"
+SUFFIX = ".scryc"
+
+TYPE_NAMES: dict[type, str] = {int: "int", bool: "bool", str: "str"}
+NAMED_TYPES: dict[str, type] = {v: k for k, v in TYPE_NAMES.items()}
+OPCODES = list(OpCode)
+
+
+def header(optimized: bool, verified: bool, auto_drop: bool = False) -> bytes:
+    version = scry.__version__.encode()
+    flags = optimized | verified << 1 | auto_drop << 2
+    return MAGIC + bytes((FORMAT, marshal.version, flags, len(version))) + version
+
+
+def source_hash(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+def cache_path(file: Path, cache_dir: Path | None = None) -> Path:
+    if cache_dir is None:
+        return file.parent / CACHE_DIR / (file.stem + SUFFIX)
+
+    location = hashlib.sha1(str(file.resolve()).encode()).hexdigest()[:16]
+    return cache_dir / f"{file.stem}-{location}{SUFFIX}"
+
+
+def generic(op: OpCode, arg: t.Any) -> OpCode:
+    # Arithmetic the VM specialized is stored as the op it replaced
+    if op in SPECIALIZED:
+        op = arg[0]
+
+    return op
+
+
+def encode_arg(op: OpCode, arg: t.Any) -> t.Any:
+    if op in SPECIALIZED:
+        return None
+
+    if op is OpCode.DECLARE:
+        return (arg[0], TYPE_NAMES[arg[1]])
+
+    if op is OpCode.PUSH_STRING:
+        return (arg[0].literal, arg[1])
+
+    if op is OpCode.MOVE:
+        # The template is rebuilt from the raw value when loading
+        return (arg[0], arg[1], arg[3])
+
+    return arg
+
+
+def decode_arg(op: OpCode, arg: t.Any) -> t.Any:
+    if op is OpCode.DECLARE:
+        return (arg[0], NAMED_TYPES[arg[1]])
+
+    if op is OpCode.PUSH_STRING:
+        return (templates.compile_template(arg[0]), arg[1])
+
+    if op is OpCode.MOVE:
+        slot, value, slots = arg
+        return (slot, value, templates.compile_template(value[1:-1]), slots)
+
+    return arg
+
+
+def dumps(
+    program: Program,
+    digest: bytes,
+    optimized: bool,
+    verified: bool,
+    auto_drop: bool = False,
+) -> bytes:
+    ops = bytes(generic(op, arg) for op, arg in program.code)
+    args = tuple(encode_arg(op, arg) for op, arg in program.code)
+    lines = program.lines.to_bytes()
+    payload = marshal.dumps((ops, args, lines, program.names, program.verified))
+    return header(optimized, verified, auto_drop) + digest + payload
+
+
+def loads(
+    data: bytes,
+    digest: bytes,
+    optimized: bool,
+    verified: bool,
+    auto_drop: bool = False,
+) -> Program | None:
+    expected = header(optimized, verified, auto_drop) + digest
+
+    if not data.startswith(expected):
+        return None
+
+    try:
+        ops, args, raw_lines, names, is_verified = marshal.loads(data[len(expected) :])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+    code: list[Instruction] = []
+
+    for op_value, arg in zip(ops, args):
+        op = OPCODES[op_value]
+        code.append(Instruction(op, decode_arg(op, arg)))
+
+    return Program(code, LineTable.from_bytes(raw_lines), names, is_verified)
+
+
+def load(
+    path: Path,
+    digest: bytes,
+    optimized: bool,
+    verified: bool,
+    auto_drop: bool = False,
+) -> Program | None:
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+
+    return loads(data, digest, optimized, verified, auto_drop)
+
+
+def store(
+    path: Path,
+    program: Program,
+    digest: bytes,
+    optimized: bool,
+    verified: bool,
+    auto_drop: bool = False,
+) -> None:
+    temp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp.write_bytes(dumps(program, digest, optimized, verified, auto_drop))
+        os.replace(temp, path)
+    except OSError:
+        # Caching is best effort, a read only location should not
+        # prevent the program from running
+        if temp.exists():
+            temp.unlink()
+
+
+def compile_file(
+    file: str | Path,
+    cache_dir: Path | None = None,
+    optimize: bool = True,
+    verify: bool = True,
+    auto_drop: bool = False,
+) -> Program:
+    file = Path(file) if isinstance(file, str) else file
+    source = file.read_bytes()
+    digest = source_hash(source)
+    path = cache_path(file, cache_dir)
+    program = load(path, digest, optimize, verify, auto_drop)
+
+    if program is None:
+        lexer = Lexer.from_buffer(source, file)
+        lexer.lex()
+        program = pipeline.build(lexer.tokens, optimize, verify, auto_drop)
+        store(path, program, digest, optimize, verify, auto_drop)
+
+    return program
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import typing as t
+
+from scry import errors
+from scry import templates
+from scry import values
+from scry.program import Instruction
+from scry.program import OpCode
+from scry.program import Program
+from scry.templates import Template
+from scry.tokens import KEYWORDS
+from scry.tokens import Token
+from scry.tokens import TokenType
+from scry.types import Type
+
+TokenIterator = t.Iterator[Token]
+
+BASIC_OPS = {
+    TokenType.ADD: OpCode.ADD,
+    TokenType.SUB: OpCode.SUB,
+    TokenType.MUL: OpCode.MUL,
+    TokenType.DIV: OpCode.DIV,
+    TokenType.FDIV: OpCode.FDIV,
+    TokenType.POW: OpCode.POW,
+}
+
+BLOCK_OPS = {
+    TokenType.IF: OpCode.IF,
+    TokenType.LOOP: OpCode.LOOP,
+    TokenType.START: OpCode.START,
+    TokenType.END: OpCode.END,
+}
+
+VARIABLE_TYPES: dict[Type, type] = {
+    Type.INT: int,
+    Type.BOOL: bool,
+    Type.STRING: str,
+}
+
+
+class Compiler:
+    def __init__(self) -> None:
+        self._pending: list[tuple[Instruction, int]] = []
+        self._slots: dict[str, int] = {}
+        self.names: list[str] = []
+        self._rules: dict[TokenType, t.Callable[[Token, TokenIterator], None]] = {
+            TokenType.PUSH: self.compile_push,
+            TokenType.PUSHD: self.compile_push,
+            TokenType.DROP: self.compile_drop,
+            TokenType.POP: self.compile_pop,
+            TokenType.VAR: self.compile_var,
+            TokenType.MOVE: self.compile_move,
+            TokenType.PRINT: self.compile_print,
+            TokenType.FOR: self.compile_for,
+            TokenType.EOF: self.compile_eof,
+        }
+
+        for token_type in BASIC_OPS:
+            self._rules[token_type] = self.compile_basic_op
+
+        for token_type in BLOCK_OPS:
+            self._rules[token_type] = self.compile_block_op
+
+    def compile(self, tokens: t.Iterable[Token]) -> Program:
+        program = Program()
+
+        for instruction, line in self.stream(tokens):
+            program.append(instruction, line)
+
+        program.names = self.names
+        return program.link()
+
+    def stream(self, tokens: t.Iterable[Token]) -> t.Iterator[tuple[Instruction, int]]:
+        # Reset eagerly so names is the list this stream fills even
+        # before the first instruction is pulled
+        self._slots = {}
+        self.names = []
+        return self.compile_stream(iter(tokens))
+
+    def compile_stream(
+        self, token_stream: TokenIterator
+    ) -> t.Iterator[tuple[Instruction, int]]:
+        for token in token_stream:
+            rule = self._rules.get(token.token_type)
+
+            if rule is None:
+                raise errors.ScryExc(
+                    f"Error parsing token, line {token.line} -> {token}",
+                    line=token.line,
+                )
+
+            try:
+                rule(token, token_stream)
+            except errors.ScryExc as e:
+                # Statements are reported at the line they start on
+                if e.line is None:
+                    e.line = token.line
+
+                raise
+            yield from self._pending
+            self._pending.clear()
+
+    def emit(self, op: OpCode, line: int, arg: t.Any = None) -> None:
+        self._pending.append((Instruction(op, arg), line))
+
+    def slot(self, name: str) -> int:
+        if name not in self._slots:
+            self._slots[name] = len(self.names)
+            self.names.append(name)
+
+        return self._slots[name]
+
+    def bind(self, template: Template) -> tuple[Template, tuple[int, ...]]:
+        return template, tuple(self.slot(name) for name in template.names)
+
+    def compile_literal(self, type_token: Token, value_token: Token) -> None:
+        if type_token.value is Type.STRING:
+            values.check_string_literal(value_token.value, type_token.line)
+            template = templates.compile_template(value_token.value[1:-1])
+
+            if template.names:
+                return self.emit(
+                    OpCode.PUSH_STRING, type_token.line, self.bind(template)
+                )
+
+            return self.emit(OpCode.PUSH, type_token.line, template.literal)
+
+        value = values.convert_literal(
+            type_token.value, value_token.value, value_token.line
+        )
+        self.emit(OpCode.PUSH, type_token.line, value)
+
+    def compile_push(self, token: Token, tokens: TokenIterator) -> None:
+        next_token = next(tokens)
+
+        if next_token.token_type is TokenType.IDENT:
+            op = OpCode.LOAD if token.token_type is TokenType.PUSH else OpCode.LOAD_DROP
+            return self.emit(op, token.line, self.slot(next_token.value))
+
+        self.compile_literal(next_token, next(tokens))
+
+    def compile_drop(self, token: Token, tokens: TokenIterator) -> None:
+        ident_token = next(tokens)
+
+        if ident_token.token_type is not TokenType.IDENT:
+            raise errors.ScryExc(
+                f"Invalid token after drop, line {token.line}"
+                f" -> {ident_token.value!r}"
+            )
+
+        self.emit(OpCode.DROP, token.line, self.slot(ident_token.value))
+
+    def compile_pop(self, token: Token, tokens: TokenIterator) -> None:
+        ident_token = next(tokens)
+
+        if ident_token.token_type is TokenType.DROP:
+            return self.emit(OpCode.POP_DROP, token.line)
+
+        if ident_token.token_type is not TokenType.IDENT:
+            raise errors.ScryExc(
+                f"Invalid token after pop, line {token.line}"
+                f" -> {ident_token.value!r}"
+            )
+
+        # A pop without a name is rejected when it is compiled, before
+        # the program runs, so it is reported ahead of the empty stack
+        # the parser engine finds first
+        if ident_token.value is None:
+            raise errors.ScryExc(f"Missing token after pop, line {token.line}")
+
+        self.emit(OpCode.STORE, ident_token.line, self.slot(ident_token.value))
+
+    def compile_basic_op(self, token: Token, tokens: TokenIterator) -> None:
+        self.emit(BASIC_OPS[token.token_type], token.line)
+
+    def compile_block_op(self, token: Token, tokens: TokenIterator) -> None:
+        self.emit(BLOCK_OPS[token.token_type], token.line)
+
+    def check_name(self, token: Token, ident_token: Token) -> None:
+        if ident_token.value.lower() in KEYWORDS:
+            raise errors.ScryExc(
+                f"Reserved keyword, line {token.line} -> {ident_token.value!r}"
+            )
+
+        if any(
+            delim in ident_token.value for delim in (" ", "(", ")", "{", "}", "[", "]")
+        ):
+            raise errors.ScryExc(
+                f"Bad variable name, line {token.line} -> "
+                f"{ident_token.value!r} can not contain spaces but does"
+            )
+
+    def compile_for(self, token: Token, tokens: TokenIterator) -> None:
+        ident_token = next(tokens)
+        self.check_name(token, ident_token)
+        # The jump target is filled in once the program is linked
+        self.emit(OpCode.FOR, token.line, (self.slot(ident_token.value), None))
+
+    def compile_var(self, token: Token, tokens: TokenIterator) -> None:
+        type_token = next(tokens)
+        ident_token = next(tokens)
+
+        if (
+            type_token.token_type is not TokenType.TYPE
+            or ident_token.token_type is not TokenType.IDENT
+        ):
+            raise errors.ScryExc(
+                f"Invalid syntax, line {token.line} "
+                f"-> var must be followed by type and then name"
+            )
+
+        self.check_name(token, ident_token)
+
+        if type_token.value not in VARIABLE_TYPES:
+            raise errors.ScryExc(
+                f"Unknown type, line {token.line}" f" -> {type_token.value!r}"
+            )
+
+        self.emit(
+            OpCode.DECLARE,
+            ident_token.line,
+            (self.slot(ident_token.value), VARIABLE_TYPES[type_token.value]),
+        )
+
+    def compile_move(self, token: Token, tokens: TokenIterator) -> None:
+        ident_token = next(tokens)
+        value_token = next(tokens)
+
+        if (
+            ident_token.token_type is not TokenType.IDENT
+            or value_token.token_type is not TokenType.VALUE
+        ):
+            raise errors.ScryExc(
+                f"Syntax error, line {token.line} -> "
+                "move requires a variable and a value to move"
+            )
+
+        # Whether the value is interpolated depends on the variables
+        # type at runtime, so the template is bound up front just in
+        # case
+        template, slots = self.bind(templates.compile_template(value_token.value[1:-1]))
+        self.emit(
+            OpCode.MOVE,
+            ident_token.line,
+            (self.slot(ident_token.value), value_token.value, template, slots),
+        )
+
+    def compile_print(self, token: Token, tokens: TokenIterator) -> None:
+        if token.value is TokenType.IDENT:
+            return self.emit(
+                OpCode.PRINT_VAR, token.line, self.slot(next(tokens).value)
+            )
+
+        self.emit(OpCode.PRINT, token.line)
+
+    def compile_eof(self, token: Token, tokens: TokenIterator) -> None:
+        self.emit(OpCode.HALT, token.line)
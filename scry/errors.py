@@ -2,4 +2,36 @@ from __future__ import annotations
 
 
 class ScryExc(Exception):
+    # Where a program failed, the source line the message points at and
+    # that line with a caret under it. Errors that name no line of their
+    # own are given the line of the failing instruction.
+    line: int | None = None
+    excerpt: str | None = None
+
+    def __init__(self, *args: object, line: int | None = None) -> None:
+        super().__init__(*args)
+
+        if line is not None:
+            self.line = line
+
+
+# Raised when a program runs past one of the limits it was given
+class LimitExceeded(ScryExc):
+    ...
+
+
+class InstructionLimitExceeded(LimitExceeded):
+    ...
+
+
+class TimeLimitExceeded(LimitExceeded):
+    ...
+
+
+class StackLimitExceeded(LimitExceeded):
+    ...
+
+
+# Raised before computing a value that would be larger than allowed
+class ValueLimitExceeded(LimitExceeded):
     ...
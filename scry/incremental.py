@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import time
+import typing as t
+from pathlib import Path
+
+from scry import pipeline
+from scry.compiler import Compiler
+from scry.interpreter import Interpreter
+from scry.interpreter import ScriptResult
+from scry.lexer import Lexer
+from scry.optimizer import Optimizer
+from scry.output import OutputSink
+from scry.program import Instruction
+from scry.program import Program
+from scry.tokens import Token
+from scry.tokens import TokenType
+
+# How often watch mode checks whether the program changed, in seconds
+WATCH_INTERVAL = 0.25
+
+
+def split_lines(source: str) -> list[str]:
+    # Lines as the lexer reads them, only ever split on newlines
+    lines = source.split("\n")
+
+    if lines[-1] == "":
+        lines.pop()
+
+    return lines
+
+
+class IncrementalCompiler:
+    def __init__(
+        self,
+        name: str | Path = "<source>",
+        optimize: bool = True,
+        verify: bool = True,
+        auto_drop: bool = False,
+    ) -> None:
+        self.optimize = optimize
+        self.verify = verify
+        self.auto_drop = auto_drop
+        self._lexer = Lexer(name)
+        # Slots are kept between updates, so the instructions of lines
+        # that did not change stay valid
+        self._compiler = Compiler()
+        self._lines: list[str] = []
+        self._code: list[list[Instruction]] = []
+        # The range of lines lexed and compiled by the last update
+        self.changed = range(0)
+
+    def diff(self, lines: list[str]) -> tuple[int, int, int]:
+        # The edited region is whatever is left once the lines both
+        # versions start and end with are skipped. Returns where it
+        # starts and where it ends in the old and in the new lines.
+        old = self._lines
+        limit = min(len(old), len(lines))
+        start = 0
+
+        while start < limit and old[start] == lines[start]:
+            start += 1
+
+        end = 0
+
+        while end < limit - start and old[-end - 1] == lines[-end - 1]:
+            end += 1
+
+        return start, len(old) - end, len(lines) - end
+
+    def lex_line(self, line_num: int, line: str, ending: str = "\n") -> list[Token]:
+        line = line.lstrip()
+
+        if not line:
+            return []
+
+        return self._lexer.tokenize(line_num, line + ending)
+
+    def update(self, source: str) -> Program:
+        lines = split_lines(source)
+        start, old_end, new_end = self.diff(lines)
+        self.changed = range(start + 1, new_end + 1)
+
+        # Lex every changed line before compiling any of them, like a
+        # full build does, and only then touch any state so an error
+        # leaves the previous version in place
+        # Error messages quote the line with its newline, if it has one
+        last = -1 if source.endswith("\n") else len(lines) - 1
+        tokens = [
+            self.lex_line(i + 1, lines[i], "" if i == last else "\n")
+            for i in range(start, new_end)
+        ]
+        code = [
+            [i for i, _ in self._compiler.compile_stream(iter(line))] for line in tokens
+        ]
+
+        self._code[start:old_end] = code
+        self._lines = lines
+        program = self.build()
+        program.source = source.encode()
+        return program
+
+    def build(self) -> Program:
+        program = Program(names=list(self._compiler.names))
+
+        for i, code in enumerate(self._code):
+            program.code.extend(code)
+            program.lines.extend([i + 1] * len(code))
+
+        eof = Token(TokenType.EOF, line=len(self._lines))
+
+        for instruction, line in self._compiler.compile_stream(iter([eof])):
+            program.append(instruction, line)
+
+        if self.optimize:
+            program = Optimizer().optimize(program)
+        else:
+            program.link()
+
+        return pipeline.analyze(program, self.verify, self.auto_drop)
+
+
+def watch(
+    file: str | Path,
+    interpreter: Interpreter,
+    output: OutputSink,
+    report: t.Callable[[ScriptResult, IncrementalCompiler], None],
+    interval: float = WATCH_INTERVAL,
+) -> None:
+    # Runs the program, then again every time it is saved, until
+    # interrupted
+    path = Path(file) if isinstance(file, str) else file
+    compiler = IncrementalCompiler(
+        path, interpreter.optimize, interpreter.verify, interpreter.auto_drop
+    )
+    mtime: int | None = None
+
+    def work(sink: OutputSink) -> None:
+        interpreter.vm(sink).run(compiler.update(path.read_text()))
+
+    while True:
+        try:
+            modified: int | None = path.stat().st_mtime_ns
+        except OSError:
+            # Probably in the middle of being saved, try again later
+            modified = None
+
+        if modified != mtime and modified is not None:
+            mtime = modified
+            report(interpreter.capture(str(path), work, output), compiler)
+
+        time.sleep(interval)
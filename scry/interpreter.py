@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import collections
+import time
+import typing as t
+from dataclasses import dataclass
+from pathlib import Path
+
+from scry import cache
+from scry import errors
+from scry import pipeline
+from scry import positions
+from scry import transpiler
+from scry.lexer import PARALLEL_MIN_BYTES
+from scry.lexer import Lexer
+from scry.limits import LimitedVM
+from scry.limits import Limits
+from scry.output import CaptureSink
+from scry.output import OutputSink
+from scry.parser import Parser
+from scry.profiler import Profile
+from scry.profiler import ProfilingParser
+from scry.profiler import ProfilingVM
+from scry.program import Program
+from scry.tokens import TokenBuffer
+from scry.vm import VM
+
+ENGINES = ("vm", "parser", "py")
+PROGRAM_CACHE_SIZE = 256
+
+
+@dataclass
+class ScriptResult:
+    file: str
+    output: str
+    error: str | None
+    seconds: float
+    # The line the error happened on with a caret under it, when known
+    excerpt: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def check(self) -> ScriptResult:
+        if self.error is not None:
+            error = errors.ScryExc(self.error)
+            error.excerpt = self.excerpt
+            raise error
+
+        return self
+
+
+class Interpreter:
+    def __init__(
+        self,
+        engine: str = "vm",
+        optimize: bool = True,
+        verify: bool = True,
+        use_cache: bool = True,
+        cache_dir: Path | None = None,
+        use_mmap: bool = False,
+        stream: bool = False,
+        profile: Profile | None = None,
+        cache_size: int = PROGRAM_CACHE_SIZE,
+        lex_jobs: int = 1,
+        limits: Limits | None = None,
+        auto_drop: bool = False,
+    ) -> None:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}")
+
+        self.engine = engine
+        self.optimize = optimize
+        self.verify = verify
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.use_mmap = use_mmap
+        self.stream = stream
+        self.profile = profile
+        self.cache_size = cache_size
+        # How many processes lex large programs, 0 for one per cpu
+        self.lex_jobs = lex_jobs
+        self.limits = limits
+        # Drop variables after their last use when the program does not
+        self.auto_drop = auto_drop
+
+        # Compiled programs by the hash of their source, least recently
+        # used first
+        self._programs: collections.OrderedDict[
+            bytes, Program
+        ] = collections.OrderedDict()
+
+    def reset(self) -> None:
+        self._programs.clear()
+
+    def remember(self, digest: bytes, program: Program) -> Program:
+        self._programs[digest] = program
+
+        if len(self._programs) > self.cache_size:
+            self._programs.popitem(last=False)
+
+        return program
+
+    def recall(self, digest: bytes) -> Program | None:
+        program = self._programs.get(digest)
+
+        if program is not None:
+            self._programs.move_to_end(digest)
+
+        return program
+
+    def lex(self, lexer: Lexer) -> TokenBuffer:
+        if self.lex_jobs == 1:
+            lexer.lex()
+        else:
+            lexer.lex_parallel(self.lex_jobs or None)
+
+        return lexer.tokens
+
+    def build(self, lexer: Lexer, data: bytes) -> Program:
+        try:
+            return pipeline.build(
+                self.lex(lexer), self.optimize, self.verify, self.auto_drop
+            )
+        except errors.ScryExc as e:
+            # Errors found before the program runs point into it too
+            positions.locate(e, data)
+            raise
+
+    def build_file(self, file: Path, data: bytes, modified: int) -> Program:
+        if self.lex_jobs == 1 or len(data) < PARALLEL_MIN_BYTES:
+            return self.build(Lexer.from_buffer(data, file), data)
+
+        # Workers read their own chunks of the file instead of being
+        # sent them, which is only right while it still holds the data
+        # that was hashed
+        program = self.build(Lexer(file), data)
+        stat = file.stat()
+
+        if stat.st_mtime_ns != modified or stat.st_size != len(data):
+            return self.build(Lexer.from_buffer(data, file), data)
+
+        return program
+
+    def compile(self, source: str | bytes, name: str | Path = "<string>") -> Program:
+        data = source.encode() if isinstance(source, str) else source
+        digest = cache.source_hash(data)
+        program = self.recall(digest)
+
+        if program is None:
+            program = self.build(Lexer.from_buffer(data, name), data)
+            program.source = data
+            self.remember(digest, program)
+
+        return program
+
+    def compile_file(self, file: str | Path) -> Program:
+        file = Path(file) if isinstance(file, str) else file
+        modified = file.stat().st_mtime_ns
+        data = file.read_bytes()
+        digest = cache.source_hash(data)
+        program = self.recall(digest)
+
+        if program is not None:
+            return program
+
+        if not self.use_cache:
+            program = self.build_file(file, data, modified)
+        else:
+            path = cache.cache_path(file, self.cache_dir)
+            program = cache.load(
+                path, digest, self.optimize, self.verify, self.auto_drop
+            )
+
+            if program is None:
+                program = self.build_file(file, data, modified)
+                cache.store(
+                    path, program, digest, self.optimize, self.verify, self.auto_drop
+                )
+
+        # Kept for showing where errors happened, never cached on disk
+        program.source = data
+        return self.remember(digest, program)
+
+    def vm(self, output: OutputSink) -> VM:
+        # The instrumented engines are only used when profiling, so
+        # normal runs pay nothing for it
+        if self.profile is not None:
+            return ProfilingVM(output, self.profile)
+
+        if self.limits is not None:
+            return LimitedVM(output, self.limits)
+
+        return VM(output)
+
+    def parser(self, output: OutputSink) -> Parser:
+        if self.profile is None:
+            return Parser(output)
+
+        return ProfilingParser(output, self.profile)
+
+    def execute(self, program: Program, output: OutputSink, name: str) -> None:
+        # Programs the py engine can not compile, profiled runs and runs
+        # with limits use the VM instead
+        if self.engine == "py" and self.profile is None and self.limits is None:
+            function = transpiler.transpile(program, name)
+
+            if function is not None:
+                return transpiler.run(function, output)
+
+        self.vm(output).run(program)
+
+    def capture(
+        self,
+        name: str,
+        work: t.Callable[[OutputSink], None],
+        output: OutputSink | None,
+    ) -> ScriptResult:
+        sink = CaptureSink() if output is None else output
+        error: str | None = None
+        excerpt: str | None = None
+        start = time.perf_counter()
+
+        try:
+            work(sink)
+        except errors.ScryExc as e:
+            error = str(e)
+            excerpt = e.excerpt
+        except OSError as e:
+            error = f"Failed to read {name!r} -> {e.strerror}"
+
+        seconds = time.perf_counter() - start
+        text = sink.getvalue() if isinstance(sink, CaptureSink) else ""
+        return ScriptResult(name, text, error, seconds, excerpt)
+
+    def run(self, file: str | Path, output: OutputSink | None = None) -> ScriptResult:
+        def work(sink: OutputSink) -> None:
+            if self.engine == "parser":
+                lexer = Lexer(file, self.use_mmap)
+                self.parser(sink).parse(self.lex(lexer))
+
+            elif self.stream:
+                lexer = Lexer(file, self.use_mmap)
+                instructions, names = pipeline.build_stream(
+                    lexer.stream(), self.optimize
+                )
+                self.vm(sink).run_stream(instructions, names)
+
+            else:
+                self.execute(self.compile_file(file), sink, str(file))
+
+        return self.capture(str(file), work, output)
+
+    def run_string(
+        self,
+        source: str | bytes,
+        name: str = "<string>",
+        output: OutputSink | None = None,
+    ) -> ScriptResult:
+        def work(sink: OutputSink) -> None:
+            if self.engine == "parser":
+                lexer = Lexer.from_buffer(source, name)
+                self.parser(sink).parse(self.lex(lexer))
+
+            else:
+                self.execute(self.compile(source, name), sink, name)
+
+        return self.capture(name, work, output)
+
+    def run_program(
+        self,
+        program: Program,
+        name: str = "<program>",
+        output: OutputSink | None = None,
+    ) -> ScriptResult:
+        return self.capture(
+            name, lambda sink: self.execute(program, sink, name), output
+        )
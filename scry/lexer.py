@@ -1,23 +1,164 @@
 from __future__ import annotations
 
+import io
+import itertools
+import mmap
+import os
+import re
+import typing as t
 from pathlib import Path
 
 from scry import errors
 from scry.tokens import Token
+from scry.tokens import TokenBuffer
 from scry.tokens import TokenType
-from scry.types import Type
+from scry.types import TYPE_NAMES
+
+Rule = t.Callable[[int, str], t.List[Token]]
+Buffer = t.Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+BASIC_OPS = {
+    "add": TokenType.ADD,
+    "sub": TokenType.SUB,
+    "mul": TokenType.MUL,
+    "div": TokenType.DIV,
+    "fdiv": TokenType.FDIV,
+    "pow": TokenType.POW,
+}
+
+# Keywords that open and close blocks, they take nothing from the line
+BLOCK_KEYWORDS = {
+    "if": TokenType.IF,
+    "loop": TokenType.LOOP,
+    "start": TokenType.START,
+    "end": TokenType.END,
+}
+
+# Programs smaller than this are lexed on one core, for them starting
+# the workers costs more than it saves
+PARALLEL_MIN_BYTES = 4 * 2**20
+
+NEWLINE = re.compile(b"\n")
+
+
+def read_chunk(source: Path | bytes, start: int, end: int) -> bytes:
+    if isinstance(source, bytes):
+        return source[start:end]
+
+    with open(source, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def chunk_offsets(source: Path | bytes, size: int, count: int) -> list[int]:
+    # Where each of up to count chunks of roughly equal size starts,
+    # always at the beginning of a line, followed by the end of the
+    # last one
+    offsets = [0]
+
+    with io.BytesIO(source) if isinstance(source, bytes) else open(source, "rb") as f:
+        for i in range(1, count):
+            f.seek(max(size * i // count, offsets[-1]))
+            f.readline()
+            offset = f.tell()
+
+            if offsets[-1] < offset < size:
+                offsets.append(offset)
+
+    offsets.append(size)
+    return offsets
+
+
+def buffer_lines(buffer: Buffer) -> t.Iterator[bytes]:
+    # Every line of the buffer with its newline, found in place so the
+    # buffer is never copied as a whole
+    start = 0
+    end = len(buffer)
+
+    if isinstance(buffer, memoryview):
+        # Views can not be searched with find, but patterns can
+        for match in NEWLINE.finditer(buffer):
+            yield buffer[start : match.end()].tobytes()
+            start = match.end()
+
+        if start < end:
+            yield buffer[start:].tobytes()
+
+        return None
+
+    while start < end:
+        stop = buffer.find(b"\n", start) + 1 or end
+        yield bytes(buffer[start:stop])
+        start = stop
+
+
+def count_lines(file: Path, start: int, end: int) -> int:
+    return read_chunk(file, start, end).count(b"\n")
+
+
+def lex_chunk(data: bytes, first_line: int) -> TokenBuffer:
+    tokens = TokenBuffer()
+    tokens.extend(Lexer("<chunk>").stream_lines(data, first_line))
+    return tokens
+
+
+def lex_file_chunk(file: Path, start: int, end: int, first_line: int) -> TokenBuffer:
+    return lex_chunk(read_chunk(file, start, end), first_line)
 
 
 class Lexer:
-    def __init__(self, file: str | Path) -> None:
+    def __init__(self, file: str | Path, use_mmap: bool = False) -> None:
         self._file = Path(file) if isinstance(file, str) else file
-        self._tokens: list[Token] = []
+        self._use_mmap = use_mmap
+        self._buffer: Buffer | None = None
+        self._tokens = TokenBuffer()
+        self._rules: dict[str, Rule] = {
+            "push": self.lex_push,
+            "pushd": self.lex_pushd,
+            "pop": self.lex_pop,
+            "drop": self.lex_drop,
+            "var": self.lex_var,
+            "move": self.lex_move,
+            "print": self.lex_print,
+            "for": self.lex_for,
+        }
+
+        for keyword, token_type in {**BASIC_OPS, **BLOCK_KEYWORDS}.items():
+            self._rules[keyword] = self.basic_op_rule(token_type)
+
+        self._byte_rules = {k.encode(): v for k, v in self._rules.items()}
+
+    @classmethod
+    def from_buffer(cls, buffer: Buffer | str, name: str | Path = "<buffer>") -> Lexer:
+        lexer = cls(name)
+        lexer._buffer = buffer.encode() if isinstance(buffer, str) else buffer
+        return lexer
 
     @property
-    def tokens(self) -> list[Token]:
+    def tokens(self) -> TokenBuffer:
         return self._tokens
 
     def lex(self) -> None:
+        self._tokens.extend(self.stream())
+
+    def stream(self) -> t.Iterator[Token]:
+        if self._buffer is not None:
+            yield from self.stream_buffer(self._buffer)
+            return None
+
+        if self._use_mmap:
+            with open(self._file, "rb") as f:
+                if not f.seek(0, 2):
+                    # Empty files can not be mapped
+                    yield from self.stream_buffer(b"")
+                    return None
+
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    yield from self.stream_buffer(buffer)
+
+            return None
+
         last_line = 0
 
         with open(self._file) as f:
@@ -28,154 +169,210 @@ class Lexer:
                 if not line:
                     continue
 
-                self.lex_next_token(last_line, line)
+                yield from self.tokenize(last_line, line)
 
-        self._tokens.append(Token(TokenType.EOF, line=last_line))
+        yield Token(TokenType.EOF, line=last_line)
 
-        # # For debugging
-        # from pprint import pprint
-        # pprint(self.tokens)
+    def stream_buffer(self, buffer: Buffer) -> t.Iterator[Token]:
+        last_line = yield from self.stream_lines(buffer)
+        yield Token(TokenType.EOF, line=last_line)
 
-    def lex_with_type(self, line_num: int, line: str) -> list[Token]:
-        data = [l.lstrip() for l in line.split(" ", maxsplit=1)]
+    def stream_lines(
+        self, buffer: Buffer, first_line: int = 0
+    ) -> t.Generator[Token, None, int]:
+        # Lines are numbered from just after first_line, the number of
+        # the last one is returned
+        last_line = first_line
 
-        if len(data) == 1:
-            return [Token(TokenType.IDENT, line=line_num, value=data[0])]
+        for line in buffer_lines(buffer):
+            data = line.split(maxsplit=1)
+            last_line += 1
 
-        type_, value = data
+            if not data:
+                continue
 
-        if type_.lower() == "int":
-            return [
-                Token(TokenType.TYPE, line=line_num, value=Type.INT),
-                Token(TokenType.VALUE, line=line_num, value=value),
-            ]
+            rule = self._byte_rules.get(data[0].lower())
 
-        if type_.lower() == "uint":
-            return [
-                Token(TokenType.TYPE, line=line_num, value=Type.UINT),
-                Token(TokenType.VALUE, line=line_num, value=value),
-            ]
+            if rule is None:
+                # Reported the way the text lexer, which reads with
+                # universal newlines, would
+                text = line.lstrip().decode().replace("\r\n", "\n")
+                raise errors.ScryExc(
+                    f"Invalid syntax, line {last_line} -> {text}", line=last_line
+                )
 
-        if type_.lower() == "float":
-            return [
-                Token(TokenType.TYPE, line=line_num, value=Type.FLOAT),
-                Token(TokenType.VALUE, line=line_num, value=value),
-            ]
+            value = data[1].rstrip(b"\r\n").decode() if len(data) > 1 else ""
+            yield from rule(last_line, value)
 
-        if type_.lower() == "ufloat":
-            return [
-                Token(TokenType.TYPE, line=line_num, value=Type.UFLOAT),
-                Token(TokenType.VALUE, line=line_num, value=value),
-            ]
+        return last_line
 
-        if type_.lower() == "bool":
-            return [
-                Token(TokenType.TYPE, line=line_num, value=Type.BOOL),
-                Token(TokenType.VALUE, line=line_num, value=value),
-            ]
+    def lex_parallel(self, jobs: int | None = None) -> None:
+        # Lines are lexed independently of each other, so the program
+        # is split into chunks of whole lines lexed by a pool of workers
+        jobs = jobs or os.cpu_count() or 1
+        source: Path | bytes = (
+            self._file if self._buffer is None else bytes(self._buffer)
+        )
+        size = source.stat().st_size if isinstance(source, Path) else len(source)
+
+        if jobs < 2 or size < PARALLEL_MIN_BYTES:
+            return self.lex()
+
+        # Imported here so lexing on one core does not load
+        # multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        offsets = chunk_offsets(source, size, jobs)
+        starts, ends = offsets[:-1], offsets[1:]
+
+        with ProcessPoolExecutor(len(starts)) as pool:
+            if isinstance(source, bytes):
+                counts = [source.count(b"\n", s, e) for s, e in zip(starts, ends)]
+                chunks = [source[s:e] for s, e in zip(starts, ends)]
+                first_lines = list(itertools.accumulate([0] + counts[:-1]))
+                results = pool.map(lex_chunk, chunks, first_lines)
+            else:
+                # Workers read their own chunk of the file, only the
+                # compact token buffers are sent back
+                counts = list(
+                    pool.map(count_lines, itertools.repeat(source), starts, ends)
+                )
+                first_lines = list(itertools.accumulate([0] + counts[:-1]))
+                results = pool.map(
+                    lex_file_chunk, itertools.repeat(source), starts, ends, first_lines
+                )
 
-        if type_.lower() == "string":
-            return [
-                Token(TokenType.TYPE, line=line_num, value=Type.STRING),
-                Token(TokenType.VALUE, line=line_num, value=value),
-            ]
+            # Results come back in order, so the first error raised is
+            # the one on the earliest line
+            for tokens in results:
+                self._tokens.extend_buffer(tokens)
 
-        raise errors.ScryExc(f"Invalid type, line {line_num} -> {line}")
+        # A last line without a newline still counts
+        last_line = sum(counts) + (read_chunk(source, size - 1, size) != b"\n")
+        self._tokens.append(Token(TokenType.EOF, line=last_line))
 
-    def lex_new_var(self, line_num: int, line: str) -> None:
-        data = self.lex_with_type(line_num, line)
-        self._tokens.append(data.pop(0))
-        self._tokens.append(
-            Token(TokenType.IDENT, line=line_num, value=data.pop(0).value)
-        )
+    def basic_op_rule(self, token_type: TokenType) -> Rule:
+        return lambda line_num, _: [Token(token_type, line=line_num)]
 
-    def lex_next_token(self, line_num: int, line: str) -> None:
-        if line.lower().startswith("pushd"):
-            raw_value = line[5:].lstrip().rstrip("\n")
-            self._tokens.append(Token(TokenType.PUSHD, line=line_num))
-            return self._tokens.extend(self.lex_with_type(line_num, raw_value))
+    def lex_with_type(self, line_num: int, line: str) -> list[Token]:
+        data = line.split(maxsplit=1)
 
-        if line.lower().startswith("push"):
-            raw_value = line[4:].lstrip().rstrip("\n")
-            self._tokens.append(Token(TokenType.PUSH, line=line_num))
-            self._tokens.extend(self.lex_with_type(line_num, raw_value))
-            return
+        if len(data) < 2:
+            value = data[0] if data else ""
+            return [Token(TokenType.IDENT, line=line_num, value=value)]
 
-        if line.lower().startswith("add"):
-            return self._tokens.append(Token(TokenType.ADD, line=line_num))
+        type_, value = data
+        type_value = TYPE_NAMES.get(type_.lower())
 
-        if line.lower().startswith("sub"):
-            return self._tokens.append(Token(TokenType.SUB, line=line_num))
+        if type_value is None:
+            raise errors.ScryExc(
+                f"Invalid type, line {line_num} -> {line}", line=line_num
+            )
 
-        if line.lower().startswith("mul"):
-            return self._tokens.append(Token(TokenType.MUL, line=line_num))
+        return [
+            Token(TokenType.TYPE, line=line_num, value=type_value),
+            Token(TokenType.VALUE, line=line_num, value=value),
+        ]
 
-        if line.lower().startswith("div"):
-            return self._tokens.append(Token(TokenType.DIV, line=line_num))
+    def lex_push(self, line_num: int, value: str) -> list[Token]:
+        tokens = [Token(TokenType.PUSH, line=line_num)]
+        tokens.extend(self.lex_with_type(line_num, value))
+        return tokens
 
-        if line.lower().startswith("fdiv"):
-            return self._tokens.append(Token(TokenType.FDIV, line=line_num))
+    def lex_pushd(self, line_num: int, value: str) -> list[Token]:
+        tokens = [Token(TokenType.PUSHD, line=line_num)]
+        tokens.extend(self.lex_with_type(line_num, value))
+        return tokens
+
+    def lex_pop(self, line_num: int, value: str) -> list[Token]:
+        if value == "drop":
+            return [
+                Token(TokenType.POP, line=line_num),
+                Token(TokenType.DROP, line=line_num),
+            ]
 
-        if line.lower().startswith("pow"):
-            return self._tokens.append(Token(TokenType.POW, line=line_num))
+        return [
+            Token(TokenType.POP, line=line_num),
+            Token(TokenType.IDENT, line=line_num, value=value or None),
+        ]
 
-        if line.lower().startswith("pop"):
-            value = line[3:].lstrip().rstrip("\n")
-            self._tokens.append(Token(TokenType.POP, line=line_num))
+    def lex_drop(self, line_num: int, value: str) -> list[Token]:
+        return [
+            Token(TokenType.DROP, line=line_num),
+            Token(TokenType.IDENT, line=line_num, value=value),
+        ]
 
-            if value == "drop":
-                return self._tokens.append(Token(TokenType.DROP, line=line_num))
+    def lex_var(self, line_num: int, value: str) -> list[Token]:
+        data = self.lex_with_type(line_num, value)
 
-            return self._tokens.append(
-                Token(
-                    TokenType.IDENT, line=line_num, value=None if value == "" else value
-                )
+        if len(data) == 1:
+            raise errors.ScryExc(
+                f"Invalid syntax, line {line_num} "
+                "-> var must be followed by type and then name",
+                line=line_num,
             )
 
-        if line.lower().startswith("drop"):
-            value = line[4:].lstrip().rstrip("\n")
-            self._tokens.append(Token(TokenType.DROP, line=line_num))
-            return self._tokens.append(
-                Token(TokenType.IDENT, line=line_num, value=value)
+        type_token, name_token = data
+        return [
+            Token(TokenType.VAR, line=line_num),
+            type_token,
+            Token(TokenType.IDENT, line=line_num, value=name_token.value),
+        ]
+
+    def lex_move(self, line_num: int, value: str) -> list[Token]:
+        try:
+            ident, data = value.split(" ", maxsplit=1)
+        except ValueError:
+            raise errors.ScryExc(
+                f"Invalid syntax, line {line_num} -> "
+                "move requires a variable and a value to move",
+                line=line_num,
             )
 
-        if line.lower().startswith("var"):
-            value = line[3:].lstrip(" ").rstrip("\n")
-            self._tokens.append(Token(TokenType.VAR, line=line_num))
-            return self.lex_new_var(line_num, value)
-
-        if line.lower().startswith("move"):
-            value = line[4:].lstrip().rstrip("\n")
+        if ident.isdigit():
+            raise errors.ScryExc(
+                f"Invalid syntax, line {line_num} -> "
+                "variables can not contain only numbers",
+                line=line_num,
+            )
 
-            try:
-                ident, data = value.split(" ", maxsplit=1)
-            except ValueError:
-                raise errors.ScryExc(
-                    f"Invalid syntax, line {line_num} -> "
-                    "move requires a variable and a value to move"
-                )
+        return [
+            Token(TokenType.MOVE, line=line_num),
+            Token(TokenType.IDENT, line=line_num, value=ident),
+            Token(TokenType.VALUE, line=line_num, value=data.lstrip()),
+        ]
+
+    def lex_print(self, line_num: int, value: str) -> list[Token]:
+        if not value:
+            return [Token(TokenType.PRINT, line=line_num)]
+
+        return [
+            Token(TokenType.PRINT, line=line_num, value=TokenType.IDENT),
+            Token(TokenType.IDENT, line=line_num, value=value),
+        ]
+
+    def lex_for(self, line_num: int, value: str) -> list[Token]:
+        if not value:
+            raise errors.ScryExc(
+                f"Invalid syntax, line {line_num} -> for must be followed by a name",
+                line=line_num,
+            )
 
-            if ident.isdigit():
-                raise errors.ScryExc(
-                    f"Invalid syntax, line {line_num} -> "
-                    "variables can not contain only numbers"
-                )
+        return [
+            Token(TokenType.FOR, line=line_num),
+            Token(TokenType.IDENT, line=line_num, value=value),
+        ]
 
-            self._tokens.append(Token(TokenType.MOVE, line=line_num))
-            self._tokens.append(Token(TokenType.IDENT, line=line_num, value=ident))
+    def tokenize(self, line_num: int, line: str) -> list[Token]:
+        data = line.split(maxsplit=1)
+        rule = self._rules.get(data[0].lower())
 
-            return self._tokens.append(
-                Token(TokenType.VALUE, line=line_num, value=data.lstrip())
+        if rule is None:
+            raise errors.ScryExc(
+                f"Invalid syntax, line {line_num} -> {line}", line=line_num
             )
 
-        if line.lower().startswith("print"):
-            self._tokens.append(Token(TokenType.PRINT, line=line_num))
+        return rule(line_num, data[1].rstrip("\n") if len(data) > 1 else "")
 
-            if not line.lower().rstrip("\n").endswith("print"):
-                value = line[5:].lstrip().rstrip("\n")
-                self._tokens[-1].value = TokenType.IDENT
-                self._tokens.append(Token(TokenType.IDENT, line=line_num, value=value))
-
-            return None
-
-        raise errors.ScryExc(f"Invalid syntax, line {line_num} -> {line}")
+    def lex_next_token(self, line_num: int, line: str) -> None:
+        self._tokens.extend(self.tokenize(line_num, line))
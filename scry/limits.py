@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import functools
+import time
+import typing as t
+from dataclasses import dataclass
+
+from scry import errors
+from scry.output import OutputSink
+from scry.program import OPERATORS
+from scry.program import SPECIALIZED
+from scry.program import OpCode
+from scry.program import Program
+from scry.ropes import STRINGS
+from scry.templates import Template
+from scry.types import UNDEFINED
+from scry.vm import VM
+from scry.vm import BoundTemplate
+from scry.vm import Handler
+
+# How many instructions run between checks of the limits
+CHECK_INTERVAL = 1024
+
+
+@dataclass(frozen=True)
+class Limits:
+    max_instructions: int | None = None
+    timeout: float | None = None
+    max_stack: int | None = None
+    max_int_bits: int | None = None
+    max_string_length: int | None = None
+
+    @property
+    def limits_sizes(self) -> bool:
+        return self.max_int_bits is not None or self.max_string_length is not None
+
+
+def string_length(value: t.Any) -> int:
+    # At most as long as the value is once converted to a string,
+    # without converting large ints which is slow
+    if type(value) in STRINGS:
+        return len(value)
+
+    if type(value) is int:
+        # Every bit after the first adds more than 0.3 digits
+        return max(value.bit_length() - 1, 0) * 3 // 10 + 1
+
+    return len(str(value))
+
+
+def int_bits(op: OpCode, a: int, b: int) -> int:
+    # At most as many bits as the result of the operator needs. Results
+    # only certainly too large are rejected before they are computed,
+    # the others are checked once they are.
+    if op is OpCode.MUL:
+        return a.bit_length() + b.bit_length() - 1 if a and b else 0
+
+    if op is OpCode.POW:
+        # Negative powers are floats, and 0, 1 and -1 stay that small
+        return (a.bit_length() - 1) * b + 1 if b > 0 and abs(a) > 1 else 0
+
+    # Sums and differences are never much larger than their operands
+    return 0
+
+
+class LimitedVM(VM):
+    def __init__(
+        self, output: OutputSink | None = None, limits: Limits | None = None
+    ) -> None:
+        super().__init__(output)
+        self.limits = Limits() if limits is None else limits
+        self.executed = 0
+        self._deadline: float | None = None
+
+        # Arithmetic and interpolation only pay for the size checks when
+        # there is a size limit
+        if self.limits.limits_sizes:
+            for handlers in (self._handlers, self._unchecked_handlers):
+                for op in OPERATORS:
+                    handlers[op] = functools.partial(self.op_limited, op, handlers[op])
+
+                for op in SPECIALIZED:
+                    handlers[op] = functools.partial(
+                        self.op_limited_specialized, handlers[op]
+                    )
+
+                handlers[OpCode.PUSH_STRING] = functools.partial(
+                    self.op_limited_template, handlers[OpCode.PUSH_STRING]
+                )
+                # The optimizer folds constant arithmetic into constants
+                # as large as the values it would compute at runtime
+                handlers[OpCode.PUSH] = functools.partial(
+                    self.op_limited_push, handlers[OpCode.PUSH]
+                )
+                handlers[OpCode.STORE_CONST] = functools.partial(
+                    self.op_limited_store_const, handlers[OpCode.STORE_CONST]
+                )
+                handlers[OpCode.MOVE] = functools.partial(
+                    self.op_limited_move, handlers[OpCode.MOVE]
+                )
+
+    def interval(self) -> int:
+        max_instructions = self.limits.max_instructions
+        max_stack = self.limits.max_stack
+        interval = CHECK_INTERVAL
+
+        if max_instructions is not None:
+            interval = min(interval, max_instructions - self.executed)
+
+        # Every instruction pushes at most one value, so the stack can
+        # only grow past its limit by the time of the next check
+        if max_stack is not None:
+            interval = min(interval, max_stack - len(self._stack) + 1)
+
+        return max(0, interval)
+
+    def check(self) -> None:
+        max_instructions = self.limits.max_instructions
+
+        # Both stop the program before the instruction it would run next
+        if max_instructions is not None and self.executed >= max_instructions:
+            line = self._lines[self._ip]
+            raise errors.InstructionLimitExceeded(
+                f"Instruction limit exceeded, line {line} "
+                f"-> more than {max_instructions} instructions",
+                line=line,
+            )
+
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            line = self._lines[self._ip]
+            raise errors.TimeLimitExceeded(
+                f"Time limit exceeded, line {line} "
+                f"-> ran for more than {self.limits.timeout} seconds",
+                line=line,
+            )
+
+        max_stack = self.limits.max_stack
+
+        if max_stack is not None and len(self._stack) > max_stack:
+            raise errors.StackLimitExceeded(
+                f"Stack limit exceeded, line {self._lines[self._ip - 1]} "
+                f"-> more than {max_stack} items"
+            )
+
+    def check_value(self, value: t.Any) -> None:
+        kind = type(value)
+
+        if kind in STRINGS:
+            self.check_string(len(value), "")
+
+        elif kind is int:
+            self.check_int(value.bit_length(), "")
+
+    def check_string(self, length: int, bound: str = "at least ") -> None:
+        max_string_length = self.limits.max_string_length
+
+        if max_string_length is not None and length > max_string_length:
+            raise errors.ValueLimitExceeded(
+                f"String limit exceeded, line {self.line} "
+                f"-> {bound}{length} characters, more than {max_string_length}"
+            )
+
+    def check_operands(self, op: OpCode, a: t.Any, b: t.Any) -> None:
+        # Rejects results that would be too large before computing them
+        if type(a) in STRINGS or type(b) in STRINGS:
+            if op is OpCode.MUL and type(a) is int:
+                self.check_string(len(b) * a)
+            elif op is OpCode.MUL and type(b) is int:
+                self.check_string(len(a) * b)
+            else:
+                # Every other operator on a string concatenates
+                self.check_string(string_length(a) + string_length(b))
+
+            return None
+
+        if type(a) is int and type(b) is int:
+            self.check_int(int_bits(op, a, b))
+
+    def check_int(self, bits: int, bound: str = "at least ") -> None:
+        max_int_bits = self.limits.max_int_bits
+
+        if max_int_bits is not None and bits > max_int_bits:
+            raise errors.ValueLimitExceeded(
+                f"Integer limit exceeded, line {self.line} "
+                f"-> {bound}{bits} bits, more than {max_int_bits}"
+            )
+
+    def check_template(self, template: Template, slots: tuple[int, ...]) -> None:
+        length = sum(map(len, template.chunks))
+
+        for slot in slots:
+            value = self._values[slot]
+
+            if value is not UNDEFINED:
+                length += string_length(value)
+
+        self.check_string(length)
+
+    def op_limited(self, op: OpCode, handler: Handler, arg: None) -> None:
+        stack = self._stack
+
+        if len(stack) > 1:
+            self.check_operands(op, stack[-1], stack[-2])
+
+        handler(arg)
+        self.check_value(stack[-1])
+
+    def op_limited_specialized(self, handler: Handler, arg: t.Any) -> None:
+        stack = self._stack
+
+        if len(stack) > 1:
+            self.check_operands(arg[0], stack[-1], stack[-2])
+
+        handler(arg)
+        self.check_value(stack[-1])
+
+    def op_limited_push(self, handler: Handler, arg: t.Any) -> None:
+        self.check_value(arg)
+        handler(arg)
+
+    def op_limited_store_const(self, handler: Handler, arg: tuple[int, t.Any]) -> None:
+        self.check_value(arg[1])
+        handler(arg)
+
+    def op_limited_template(self, handler: Handler, arg: BoundTemplate) -> None:
+        self.check_template(*arg)
+        handler(arg)
+        self.check_value(self._stack[-1])
+
+    def op_limited_move(
+        self, handler: Handler, arg: tuple[int, str, Template, tuple[int, ...]]
+    ) -> None:
+        self.check_template(arg[2], arg[3])
+        handler(arg)
+        self.check_value(self._values[arg[0]])
+
+    def execute(self, program: Program) -> None:
+        if self._deadline is None and self.limits.timeout is not None:
+            self._deadline = time.monotonic() + self.limits.timeout
+
+        handlers = self.load(program)
+        code = self._code
+        end = len(code)
+
+        # Counting down to the next check keeps the cost of the limits
+        # to a decrement per instruction
+        interval = countdown = self.interval()
+
+        try:
+            while self._ip < end:
+                if countdown <= 0:
+                    self.executed += interval
+                    interval = 0
+                    self.check()
+                    interval = countdown = self.interval()
+
+                countdown -= 1
+                op, arg = code[self._ip]
+                self._ip += 1
+                handlers[op](arg)
+        finally:
+            self.executed += interval - countdown
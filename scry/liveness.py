@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import collections
+import typing as t
+from dataclasses import dataclass
+
+from scry import errors
+from scry.program import BLOCK_ENDS
+from scry.program import BLOCK_STARTS
+from scry.program import Instruction
+from scry.program import OpCode
+from scry.program import Program
+
+# Ops that read or write the variable in their slot
+SLOT_OPS = frozenset((OpCode.LOAD, OpCode.LOAD_DROP, OpCode.STORE, OpCode.PRINT_VAR))
+
+
+@dataclass
+class Lifetime:
+    slot: int
+    # How many blocks the declaration is in
+    depth: int
+    # The instruction that declared the variable, or last stored to it
+    defined: int
+    # The last instruction that used the variable, -1 when none did,
+    # and the instruction its value is needed until. They differ when
+    # the last use is in a block, which might run again or be skipped,
+    # so the value is only released once the whole block is done.
+    used: int
+    needed: int
+    # The instruction that drops the variable, None when nothing does
+    dropped: int | None = None
+
+
+def block_end(instruction: Instruction) -> int:
+    # The index of the end of the block a linked instruction starts
+    op, arg = instruction
+
+    if op is OpCode.START:
+        return t.cast(int, arg)
+
+    if op is OpCode.FOR:
+        return t.cast(int, arg[1]) - 1
+
+    return t.cast(int, arg) - 1
+
+
+def slots_used(op: OpCode, arg: t.Any) -> tuple[int, ...]:
+    if op in SLOT_OPS:
+        return (arg,)
+
+    if op is OpCode.STORE_CONST:
+        return (arg[0],)
+
+    if op is OpCode.MOVE:
+        return (arg[0], *arg[3])
+
+    if op is OpCode.PUSH_STRING:
+        return t.cast(t.Tuple[int, ...], arg[1])
+
+    return ()
+
+
+def lifetimes(program: Program) -> list[Lifetime] | None:
+    # Every declared variable, from its declaration to its drop. None
+    # when a variable is declared twice or leaves the block it was
+    # declared in, those programs fail at runtime or are left to it.
+    code = program.code
+    blocks: list[int] = []
+    live: dict[int, Lifetime] = {}
+    found: list[Lifetime] = []
+
+    for i, (op, arg) in enumerate(code):
+        for slot in slots_used(op, arg):
+            lifetime = live.get(slot)
+
+            # Loop variables are not declared, they live in their block
+            if lifetime is None:
+                continue
+
+            lifetime.used = i
+            needed = i
+
+            if len(blocks) > lifetime.depth:
+                needed = block_end(code[blocks[lifetime.depth]])
+
+            lifetime.needed = max(lifetime.needed, needed)
+
+        if op is OpCode.DECLARE:
+            if arg[0] in live:
+                return None
+
+            live[arg[0]] = Lifetime(arg[0], len(blocks), i, -1, i)
+
+        elif op in (OpCode.STORE, OpCode.STORE_CONST):
+            slot = arg if op is OpCode.STORE else arg[0]
+
+            if slot in live:
+                live[slot].defined = i
+
+        elif op in (OpCode.DROP, OpCode.LOAD_DROP) and arg in live:
+            lifetime = live.pop(arg)
+
+            if lifetime.depth != len(blocks):
+                return None
+
+            lifetime.dropped = i
+            found.append(lifetime)
+
+        elif op in BLOCK_STARTS:
+            blocks.append(i)
+
+        elif op in BLOCK_ENDS:
+            if any(lifetime.depth == len(blocks) for lifetime in live.values()):
+                return None
+
+            blocks.pop()
+
+    found.extend(live.values())
+    found.sort(key=lambda lifetime: lifetime.defined)
+    return found
+
+
+def describe(program: Program, lifetime: Lifetime) -> str:
+    lines = program.lines
+    text = f"line {lines[lifetime.defined]} -> {program.names[lifetime.slot]!r}"
+
+    if lifetime.used < 0:
+        return f"{text} (never used)"
+
+    return f"{text} (last used on line {lines[lifetime.used]})"
+
+
+def undropped(program: Program) -> dict[int, str]:
+    # How to describe each variable that is never dropped, by its slot
+    found = lifetimes(program) or []
+    return {
+        lifetime.slot: describe(program, lifetime)
+        for lifetime in found
+        if lifetime.dropped is None
+    }
+
+
+def check(program: Program) -> None:
+    # Reports variables that are never dropped before the program runs,
+    # for programs the verifier could not check as a whole
+    found = lifetimes(program) or []
+    missing = [lifetime for lifetime in found if lifetime.dropped is None]
+
+    if missing:
+        raise errors.ScryExc(
+            "Variables not dropped: %s"
+            % ", ".join(describe(program, lifetime) for lifetime in missing),
+            line=program.lines[missing[0].defined],
+        )
+
+
+def release(program: Program) -> Program:
+    # Drops every variable the program never drops after its last use,
+    # and releases the value of the others until they are dropped
+    found = lifetimes(program)
+
+    if not found:
+        return program
+
+    inserted: dict[int, list[Instruction]] = collections.defaultdict(list)
+
+    for lifetime in found:
+        if lifetime.dropped is None:
+            inserted[lifetime.needed].append(Instruction(OpCode.DROP, lifetime.slot))
+        elif lifetime.needed + 1 < lifetime.dropped:
+            inserted[lifetime.needed].append(Instruction(OpCode.RELEASE, lifetime.slot))
+
+    if not inserted:
+        return program
+
+    released = Program(names=program.names, source=program.source)
+
+    for i, (instruction, line) in enumerate(zip(program.code, program.lines)):
+        released.append(instruction, line)
+
+        for extra in inserted.get(i, ()):
+            released.append(extra, line)
+
+    # Every jump moved with the inserted instructions
+    return released.link()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import typing as t
+
+from scry.program import OPERATORS
+from scry.program import Instruction
+from scry.program import OpCode
+from scry.program import Program
+
+Entry = t.Tuple[Instruction, int]
+
+# Folded constants larger than this are left to be computed at runtime,
+# so the optimizer never bloats the program or stalls compilation
+MAX_FOLD_SIZE = 4096
+
+
+def fold_size_ok(op: OpCode, a: t.Any, b: t.Any) -> bool:
+    if op is OpCode.POW and type(a) is int and type(b) is int:
+        return b < 0 or abs(a) < 2 or a.bit_length() * b <= MAX_FOLD_SIZE
+
+    if op is OpCode.MUL:
+        if type(a) is str and type(b) is int:
+            return len(a) * b <= MAX_FOLD_SIZE
+
+        if type(a) is int and type(b) is str:
+            return a * len(b) <= MAX_FOLD_SIZE
+
+    return True
+
+
+class Optimizer:
+    def optimize(self, program: Program) -> Program:
+        optimized = Program(names=program.names)
+
+        for instruction, line in self.stream(zip(program.code, program.lines)):
+            optimized.append(instruction, line)
+
+        # Removed instructions moved the jump targets
+        return optimized.link()
+
+    def stream(self, instructions: t.Iterable[Entry]) -> t.Iterator[Entry]:
+        window: list[Entry] = []
+
+        for entry in instructions:
+            window.append(entry)
+            self.reduce(window)
+
+            # Only a trailing run of constant pushes can still be
+            # rewritten by later instructions, everything before it
+            # is final
+            tail = len(window)
+
+            while tail and window[tail - 1][0].op is OpCode.PUSH:
+                tail -= 1
+
+            if tail:
+                yield from window[:tail]
+                del window[:tail]
+
+        yield from window
+
+    def reduce(self, window: list[Entry]) -> None:
+        (op, arg), line = window[-1]
+
+        if len(window) < 2 or window[-2][0].op is not OpCode.PUSH:
+            return None
+
+        if op is OpCode.POP_DROP:
+            del window[-2:]
+
+        elif op is OpCode.STORE:
+            value = window[-2][0].arg
+            window[-2:] = [(Instruction(OpCode.STORE_CONST, (arg, value)), line)]
+
+        elif op in OPERATORS and len(window) > 2:
+            if window[-3][0].op is not OpCode.PUSH:
+                return None
+
+            a = window[-2][0].arg
+            b = window[-3][0].arg
+
+            # Bool arithmetic is an error, leave it for the runtime to
+            # report on the line it happens
+            if isinstance(a, bool) or isinstance(b, bool):
+                return None
+
+            if not fold_size_ok(op, a, b):
+                return None
+
+            try:
+                value = OPERATORS[op](a, b)
+            except TypeError:
+                value = str(a) + str(b)
+            except Exception:
+                # Division by zero and friends are raised at runtime
+                return None
+
+            window[-3:] = [(Instruction(OpCode.PUSH, value), line)]
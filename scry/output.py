@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import abc
+import io
+import sys
+import typing as t
+from dataclasses import dataclass
+
+DEFAULT_FLUSH_BYTES = 8192
+
+
+class Stream(t.Protocol):
+    def write(self, text: str) -> int:
+        ...
+
+    def flush(self) -> None:
+        ...
+
+
+@dataclass
+class FlushPolicy:
+    # Flush once this many characters are buffered, None for no limit
+    max_bytes: int | None = DEFAULT_FLUSH_BYTES
+    # Flush once this many lines are buffered, None for no limit
+    max_lines: int | None = None
+
+    @classmethod
+    def for_stream(cls, stream: Stream) -> FlushPolicy:
+        try:
+            interactive = stream.isatty()  # type: ignore[attr-defined]
+        except (AttributeError, ValueError):
+            interactive = False
+
+        # Someone is watching, show each line as soon as it is printed
+        return cls(max_lines=1) if interactive else cls()
+
+
+class OutputSink(abc.ABC):
+    @abc.abstractmethod
+    def write_line(self, value: t.Any) -> None:
+        ...
+
+    def flush(self) -> None:
+        return None
+
+
+class BufferedSink(OutputSink):
+    def __init__(
+        self, stream: Stream | None = None, policy: FlushPolicy | None = None
+    ) -> None:
+        self._stream = sys.stdout if stream is None else stream
+        self._policy = (
+            FlushPolicy.for_stream(self._stream) if policy is None else policy
+        )
+        self._parts: list[str] = []
+        self._size = 0
+
+    def write_line(self, value: t.Any) -> None:
+        text = value if type(value) is str else str(value)
+        self._parts.append(text)
+        self._size += len(text) + 1
+
+        max_bytes = self._policy.max_bytes
+        max_lines = self._policy.max_lines
+
+        if (max_bytes is not None and self._size >= max_bytes) or (
+            max_lines is not None and len(self._parts) >= max_lines
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if self._parts:
+            self._parts.append("")
+            self._stream.write("\n".join(self._parts))
+            self._parts.clear()
+            self._size = 0
+
+        self._stream.flush()
+
+
+class CaptureSink(OutputSink):
+    def __init__(self, target: list[str] | io.StringIO | None = None) -> None:
+        self._target: list[str] | io.StringIO = [] if target is None else target
+
+    @property
+    def target(self) -> list[str] | io.StringIO:
+        return self._target
+
+    def write_line(self, value: t.Any) -> None:
+        text = value if type(value) is str else str(value)
+
+        if isinstance(self._target, list):
+            self._target.append(text)
+        else:
+            self._target.write(text + "\n")
+
+    def getvalue(self) -> str:
+        if isinstance(self._target, list):
+            return "".join(line + "\n" for line in self._target)
+
+        return self._target.getvalue()
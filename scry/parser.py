@@ -1,113 +1,47 @@
 from __future__ import annotations
 
-import re
 import typing as t
 
 from scry import errors
+from scry import ropes
+from scry import values
+from scry.compiler import BASIC_OPS
+from scry.output import BufferedSink
+from scry.output import OutputSink
+from scry.program import OPERATORS
 from scry.tokens import KEYWORDS
 from scry.tokens import Token
 from scry.tokens import TokenType
 from scry.types import Type
 from scry.types import Variable
 
+BLOCK_TOKENS = frozenset(
+    (TokenType.IF, TokenType.LOOP, TokenType.FOR, TokenType.START, TokenType.END)
+)
+
 
 class Parser:
-    def __init__(self) -> None:
+    def __init__(self, output: OutputSink | None = None) -> None:
+        self.output = BufferedSink() if output is None else output
         self._stack: list[t.Any] = []
         self._state: dict[str, Variable] = {}
 
     def convert_value_to_type(self, type_token: Token, value_token: Token) -> t.Any:
-        if type_token.value in (Type.INT, Type.UINT):
-            if "." in value_token.value:
-                raise errors.ScryExc(
-                    "Value incompatible with type, line "
-                    f"{value_token.line} -> {value_token.value!r}"
-                )
-
-            iconverted = int(value_token.value)
-
-            if type_token.value is Type.UINT and iconverted < 0:
-                raise errors.ScryExc(
-                    "Unsigned int can not be negative, line "
-                    f"{value_token.line} -> {value_token.value!r}"
-                )
-
-            return iconverted
-
-        if type_token.value in (Type.FLOAT, Type.UFLOAT):
-            fconverted = float(value_token.value)
-
-            if type_token.value is Type.UFLOAT and fconverted < 0:
-                raise errors.ScryExc(
-                    "Unsigned float can not be negative, line "
-                    f"{value_token.line} -> {value_token.value!r}"
-                )
-
-            return fconverted
-
-        if type_token.value is Type.BOOL:
-            string = value_token.value.lower()
-
-            if string == "true":
-                return True
-
-            if string == "false":
-                return False
-
-            raise errors.ScryExc(
-                "Invalid boolean value, line " f"{type_token.line} -> {string!r}"
-            )
-
         if type_token.value is Type.STRING:
-            new_string: str = value_token.value
-
-            if not new_string.startswith('"'):
-                raise errors.ScryExc(f'Missing opening `"`, line {type_token.line}')
-
-            if not new_string.endswith('"'):
-                raise errors.ScryExc(f'Missing closing `"`, line {type_token.line}')
+            values.check_string_literal(value_token.value, type_token.line)
+            return values.interpolate(value_token.value, self._state, type_token.line)
 
-            var_regex = re.compile(r"\$\{(.*)\}")
-            var_matches = var_regex.findall(new_string)
-
-            for match in var_matches:
-                if match not in self._state:
-                    raise errors.ScryExc(
-                        f"Unknown symbol, line {type_token.line} -> {match!r}"
-                    )
-
-                replacement = self._state[match].value
-                new_string = new_string.replace(
-                    "${" + match + "}",
-                    replacement if isinstance(replacement, str) else str(replacement),
-                )
-
-            return new_string[1:-1]
-
-        raise errors.ScryExc(f"Failed to parse types, line {type_token.line}")
+        return values.convert_literal(
+            type_token.value, value_token.value, value_token.line
+        )
 
     def get_op_func(
-        self, line: int, op: TokenType, a: t.Any, b: t.Any
-    ) -> t.Callable[[], t.Any]:
-        if op is TokenType.ADD:
-            return lambda: a + b
-
-        elif op is TokenType.SUB:
-            return lambda: a - b
-
-        elif op is TokenType.MUL:
-            return lambda: a * b
-
-        elif op is TokenType.DIV:
-            return lambda: a / b
+        self, line: int, op: TokenType
+    ) -> t.Callable[[t.Any, t.Any], t.Any]:
+        if op not in BASIC_OPS:
+            raise errors.ScryExc(f"Invalid basic op, line {line}")
 
-        elif op is TokenType.FDIV:
-            return lambda: a // b
-
-        elif op is TokenType.POW:
-            return lambda: a**b
-
-        raise errors.ScryExc(f"Invalid basic op, line {line}")
+        return OPERATORS[BASIC_OPS[op]]
 
     def perform_basic_op(self, op: TokenType, line: int) -> None:
         try:
@@ -119,19 +53,30 @@ class Parser:
         if isinstance(a, bool) or isinstance(b, bool):
             raise errors.ScryExc(f"Cannot perform basic ops on bools, line {line}")
 
-        op_func = self.get_op_func(line, op, a, b)
+        op_func = self.get_op_func(line, op)
+
+        # Every operator on two strings falls back to concatenation
+        if type(a) in ropes.STRINGS and type(b) in ropes.STRINGS:
+            return self._stack.append(ropes.concat(a, b))
 
         try:
-            self._stack.append(op_func())
+            self._stack.append(op_func(a, b))
         except TypeError:
-            return self._stack.append(str(a) + str(b))
+            return self._stack.append(ropes.concat(a, b))
+
+    def parse(self, tokens: t.Iterable[Token]) -> None:
+        try:
+            self.evaluate(tokens)
+        finally:
+            self.output.flush()
 
-    def parse(self, tokens: list[Token]) -> None:
-        while len(tokens) > 0:
-            token = tokens.pop(0)
+    def evaluate(self, tokens: t.Iterable[Token]) -> None:
+        stream = iter(tokens)
+
+        for token in stream:
 
             if token.token_type is TokenType.PUSH:
-                next_token = tokens.pop(0)
+                next_token = next(stream)
 
                 if next_token.token_type is TokenType.IDENT:
                     if next_token.value not in self._state:
@@ -144,11 +89,11 @@ class Parser:
 
                 else:
                     self._stack.append(
-                        self.convert_value_to_type(next_token, tokens.pop(0))
+                        self.convert_value_to_type(next_token, next(stream))
                     )
 
             elif token.token_type is TokenType.PUSHD:
-                next_token = tokens.pop(0)
+                next_token = next(stream)
 
                 if next_token.token_type is TokenType.IDENT:
                     popped = self._state.pop(next_token.value, None)
@@ -163,11 +108,11 @@ class Parser:
 
                 else:
                     self._stack.append(
-                        self.convert_value_to_type(next_token, tokens.pop(0))
+                        self.convert_value_to_type(next_token, next(stream))
                     )
 
             elif token.token_type is TokenType.DROP:
-                ident_token = tokens.pop(0)
+                ident_token = next(stream)
 
                 if ident_token.token_type is not TokenType.IDENT:
                     raise errors.ScryExc(
@@ -188,7 +133,7 @@ class Parser:
                         f"Not enough data on the stack, line {token.line}"
                     )
 
-                ident_token = tokens.pop(0)
+                ident_token = next(stream)
                 if ident_token.token_type is TokenType.DROP:
                     self._stack.pop()
                     continue
@@ -212,7 +157,7 @@ class Parser:
 
                 popped = self._stack.pop()
                 self._state[ident_token.value] = Variable(
-                    ident_token.value, type(popped), ident_token.line, popped
+                    ident_token.value, ropes.kind(popped), ident_token.line, popped
                 )
 
             elif token.token_type in (
@@ -226,8 +171,8 @@ class Parser:
                 self.perform_basic_op(token.token_type, token.line)
 
             elif token.token_type is TokenType.VAR:
-                type_token = tokens.pop(0)
-                ident_token = tokens.pop(0)
+                type_token = next(stream)
+                ident_token = next(stream)
                 variable_type: type
 
                 if (
@@ -274,8 +219,8 @@ class Parser:
                 self._state[variable.name] = variable
 
             elif token.token_type is TokenType.MOVE:
-                ident_token = tokens.pop(0)
-                value_token = tokens.pop(0)
+                ident_token = next(stream)
+                value_token = next(stream)
 
                 if (
                     ident_token.token_type is not TokenType.IDENT
@@ -309,7 +254,7 @@ class Parser:
 
             elif token.token_type is TokenType.PRINT:
                 if token.value is TokenType.IDENT:
-                    next_token = tokens.pop(0)
+                    next_token = next(stream)
 
                     if next_token.value not in self._state:
                         raise errors.ScryExc(
@@ -328,7 +273,7 @@ class Parser:
 
                     target = self._stack.pop()
 
-                print(target)
+                self.output.write_line(target)
 
             elif token.token_type is TokenType.EOF:
                 if self._stack:
@@ -345,6 +290,12 @@ class Parser:
                         )
                     )
 
+            elif token.token_type in BLOCK_TOKENS:
+                raise errors.ScryExc(
+                    f"Unsupported by the parser engine, line {token.line} "
+                    f"-> {token.token_type.name.lower()} needs the vm engine"
+                )
+
             else:
                 raise errors.ScryExc(
                     f"Error parsing token, line {token.line} -> {token}"
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import typing as t
+
+from scry import liveness
+from scry.compiler import Compiler
+from scry.optimizer import Entry
+from scry.optimizer import Optimizer
+from scry.program import Program
+from scry.tokens import Token
+from scry.verifier import Verifier
+
+
+def build(
+    tokens: t.Iterable[Token],
+    optimize: bool = True,
+    verify: bool = True,
+    auto_drop: bool = False,
+) -> Program:
+    program = Compiler().compile(tokens)
+
+    if optimize:
+        program = Optimizer().optimize(program)
+
+    return analyze(program, verify, auto_drop)
+
+
+def analyze(program: Program, verify: bool = True, auto_drop: bool = False) -> Program:
+    if auto_drop:
+        program = liveness.release(program)
+
+    # Programs the verifier can not check as a whole still have their
+    # drops checked before they run
+    if verify and not Verifier().verify(program):
+        liveness.check(program)
+
+    return program
+
+
+def build_stream(
+    tokens: t.Iterable[Token], optimize: bool = True
+) -> tuple[t.Iterator[Entry], list[str]]:
+    compiler = Compiler()
+    instructions = compiler.stream(tokens)
+
+    if optimize:
+        instructions = Optimizer().stream(instructions)
+
+    return instructions, compiler.names
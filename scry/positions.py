@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import itertools
+import typing as t
+
+from scry import errors
+
+
+def zigzag(value: int) -> int:
+    # Signed to unsigned, lines go backwards when passes move code
+    return value << 1 if value >= 0 else -value << 1 | 1
+
+
+def write_varint(data: bytearray, value: int) -> None:
+    while value > 0x7F:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+
+    data.append(value)
+
+
+def write_run(data: bytearray, run: int, delta: int) -> None:
+    delta = zigzag(delta)
+
+    # Nearly every run is a few instructions a few lines on
+    if run < 0x80 and delta < 0x80:
+        data += bytes((run, delta))
+    else:
+        write_varint(data, run)
+        write_varint(data, delta)
+
+
+def read_varint(data: bytes | bytearray, index: int) -> tuple[int, int]:
+    # Returns the value and the index just past it
+    value = shift = 0
+
+    while True:
+        byte = data[index]
+        index += 1
+        value |= (byte & 0x7F) << shift
+
+        if byte < 0x80:
+            return value, index
+
+        shift += 7
+
+
+class LineTable:
+    # The source line of every instruction, delta encoded like the line
+    # table of a CPython code object. Each run of instructions on one
+    # line is stored as its length and the difference between its line
+    # and the line of the run before. Finding the line of a single
+    # instruction walks the runs, which only happens for errors.
+    __slots__ = ("_data", "_length", "_previous", "_line", "_run")
+
+    def __init__(self, lines: t.Iterable[int] = ()) -> None:
+        self._data = bytearray()
+        self._length = 0
+        # The line of the last run written to the data
+        self._previous = 0
+        # The run still being added to, written once the line changes
+        self._line = 0
+        self._run = 0
+        self.extend(lines)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> t.Iterator[int]:
+        for run, line in self.runs():
+            yield from itertools.repeat(line, run)
+
+    def __getitem__(self, index: int) -> int:
+        if index < 0:
+            index += self._length
+
+        if not 0 <= index < self._length:
+            raise IndexError("line table index out of range")
+
+        for run, line in self.runs():
+            if index < run:
+                return line
+
+            index -= run
+
+        raise AssertionError("unreachable")
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, LineTable):
+            return NotImplemented
+
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"LineTable({list(self)!r})"
+
+    def append(self, line: int) -> None:
+        self._length += 1
+
+        if line == self._line and self._run:
+            self._run += 1
+            return None
+
+        self.close_run()
+        self._line = line
+        self._run = 1
+
+    def extend(self, lines: t.Iterable[int]) -> None:
+        for line in lines:
+            self.append(line)
+
+    def close_run(self) -> None:
+        if self._run:
+            write_run(self._data, self._run, self._line - self._previous)
+            self._previous = self._line
+            self._run = 0
+
+    def runs(self) -> t.Iterator[tuple[int, int]]:
+        data = self._data
+        index = 0
+        line = 0
+
+        end = len(data)
+
+        while index < end:
+            run = data[index]
+            delta = data[index + 1]
+
+            if run < 0x80 and delta < 0x80:
+                index += 2
+            else:
+                run, index = read_varint(data, index)
+                delta, index = read_varint(data, index)
+
+            line += -(delta >> 1) if delta & 1 else delta >> 1
+            yield run, line
+
+        if self._run:
+            yield self._run, self._line
+
+    def to_bytes(self) -> bytes:
+        data = bytearray(self._data)
+
+        if self._run:
+            write_run(data, self._run, self._line - self._previous)
+
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> LineTable:
+        table = cls()
+        table._data[:] = data
+
+        for run, line in table.runs():
+            table._length += run
+            table._previous = line
+
+        return table
+
+
+def excerpt(source: bytes, line: int) -> str | None:
+    # The source line followed by carets under the statement on it
+    lines = source.splitlines()
+
+    if not 0 < line <= len(lines):
+        return None
+
+    text = lines[line - 1].decode(errors="replace").rstrip().expandtabs()
+    column = len(text) - len(text.lstrip())
+    width = max(len(text) - column, 1)
+    gutter = max(len(str(line)), 5)
+    return (
+        f"{line:>{gutter}} | {text}\n" f"{' ' * gutter} | {' ' * column}{'^' * width}\n"
+    )
+
+
+def locate(error: errors.ScryExc, source: bytes | None) -> None:
+    if error.line is not None and source is not None:
+        error.excerpt = excerpt(source, error.line)
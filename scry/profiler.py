@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import json
+import time
+import typing as t
+
+from scry.output import OutputSink
+from scry.parser import Parser
+from scry.program import OpCode
+from scry.program import Program
+from scry.tokens import Token
+from scry.tokens import TokenType
+from scry.vm import VM
+
+FORMATS = ("report", "json", "collapsed")
+REPORT_LINES = 20
+
+# A source line and the name of an op executed on it
+Site = t.Tuple[int, str]
+
+
+class Profile:
+    def __init__(self, name: str = "scry") -> None:
+        self.name = name
+        # Execution count and total nanoseconds spent in each site
+        self.sites: dict[Site, list[int]] = {}
+        self.max_stack = 0
+        self.max_variables = 0
+
+    def add(self, site: Site, elapsed: int) -> None:
+        stat = self.sites.get(site)
+
+        if stat is None:
+            self.sites[site] = [1, elapsed]
+        else:
+            stat[0] += 1
+            stat[1] += elapsed
+
+    def observe(self, stack: int, variables: int) -> None:
+        if stack > self.max_stack:
+            self.max_stack = stack
+
+        if variables > self.max_variables:
+            self.max_variables = variables
+
+    def totals(self, by_line: bool) -> dict[t.Any, list[int]]:
+        totals: dict[t.Any, list[int]] = {}
+
+        for (line, op), (count, elapsed) in self.sites.items():
+            stat = totals.setdefault(line if by_line else op, [0, 0])
+            stat[0] += count
+            stat[1] += elapsed
+
+        return dict(sorted(totals.items(), key=lambda item: -item[1][1]))
+
+    @property
+    def count(self) -> int:
+        return sum(count for count, _ in self.sites.values())
+
+    @property
+    def elapsed(self) -> int:
+        return sum(elapsed for _, elapsed in self.sites.values())
+
+    def to_json(self) -> dict[str, t.Any]:
+        def stats(totals: dict[t.Any, list[int]]) -> dict[str, t.Any]:
+            return {
+                str(key): {"count": count, "seconds": elapsed / 1e9}
+                for key, (count, elapsed) in totals.items()
+            }
+
+        return {
+            "name": self.name,
+            "count": self.count,
+            "seconds": self.elapsed / 1e9,
+            "max_stack": self.max_stack,
+            "max_variables": self.max_variables,
+            "ops": stats(self.totals(by_line=False)),
+            "lines": stats(self.totals(by_line=True)),
+        }
+
+    def collapsed(self) -> str:
+        # One "frame;frame;frame value" entry per site, the format read
+        # by flamegraph.pl, speedscope and friends. Values are in
+        # microseconds.
+        return "".join(
+            f"{self.name};line {line};{op} {elapsed // 1000}\n"
+            for (line, op), (_, elapsed) in sorted(self.sites.items())
+        )
+
+    def report(self, limit: int = REPORT_LINES) -> str:
+        elapsed = self.elapsed or 1
+        lines = [
+            f"Profile of {self.name}: {self.count:,} ops in "
+            f"{self.elapsed / 1e6:.3f} ms, peak stack depth {self.max_stack}, "
+            f"peak variables {self.max_variables}",
+            "",
+            f"{'op':<16}{'count':>12}{'total ms':>12}{'avg ns':>10}{'%':>8}",
+        ]
+
+        for op, (count, total) in self.totals(by_line=False).items():
+            lines.append(
+                f"{op:<16}{count:>12,}{total / 1e6:>12.3f}"
+                f"{total // count:>10,}{total / elapsed:>8.1%}"
+            )
+
+        lines.extend(
+            ("", f"{'line':<16}{'count':>12}{'total ms':>12}{'avg ns':>10}{'%':>8}")
+        )
+
+        for line, (count, total) in list(self.totals(by_line=True).items())[:limit]:
+            lines.append(
+                f"{line:<16}{count:>12,}{total / 1e6:>12.3f}"
+                f"{total // count:>10,}{total / elapsed:>8.1%}"
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def render(self, kind: str) -> str:
+        if kind == "json":
+            return json.dumps(self.to_json(), indent=2) + "\n"
+
+        if kind == "collapsed":
+            return self.collapsed()
+
+        return self.report()
+
+
+class ProfilingVM(VM):
+    def __init__(
+        self, output: OutputSink | None = None, profile: Profile | None = None
+    ) -> None:
+        super().__init__(output)
+        self.profile = Profile() if profile is None else profile
+
+    def execute(self, program: Program) -> None:
+        handlers = self.load(program)
+        code = self._code
+        # Decoded once, looking lines up in the table is slow
+        lines = list(self._lines)
+        stack = self._stack
+        defined = self._defined
+        profile = self.profile
+        clock = time.perf_counter_ns
+        names = [op.name for op in OpCode]
+        end = len(code)
+
+        while self._ip < end:
+            ip = self._ip
+            op, arg = code[ip]
+            self._ip += 1
+            start = clock()
+
+            try:
+                handlers[op](arg)
+            finally:
+                profile.add((lines[ip], names[op]), clock() - start)
+                profile.observe(len(stack), len(defined))
+
+
+class ProfilingParser(Parser):
+    def __init__(
+        self, output: OutputSink | None = None, profile: Profile | None = None
+    ) -> None:
+        super().__init__(output)
+        self.profile = Profile() if profile is None else profile
+
+    def evaluate(self, tokens: t.Iterable[Token]) -> None:
+        stream = self.instrument(tokens)
+
+        try:
+            super().evaluate(stream)
+        finally:
+            # Records the statement that was running if parsing failed
+            stream.close()
+
+    def instrument(self, tokens: t.Iterable[Token]) -> t.Generator[Token, None, None]:
+        # Every statement is on a line of its own, so the time between
+        # handing out the first token of one line and the first token of
+        # the next is spent executing that line
+        clock = time.perf_counter_ns
+        site: Site | None = None
+        start = 0
+
+        try:
+            for token in tokens:
+                if (
+                    site is None
+                    or token.line != site[0]
+                    or token.token_type is TokenType.EOF
+                ):
+                    now = clock()
+
+                    if site is not None:
+                        self.profile.add(site, now - start)
+                        self.profile.observe(len(self._stack), len(self._state))
+
+                    site = (token.line, token.token_type.name)
+                    start = now
+
+                yield token
+        finally:
+            if site is not None:
+                self.profile.add(site, clock() - start)
+                self.profile.observe(len(self._stack), len(self._state))
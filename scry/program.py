@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import enum
+import operator
+import typing as t
+from dataclasses import dataclass
+from dataclasses import field
+
+from scry import errors
+from scry.positions import LineTable
+
+
+class OpCode(enum.IntEnum):
+    PUSH = 0  # Push a constant onto the stack
+    PUSH_STRING = 1  # Push a string literal, interpolating variables
+    LOAD = 2  # Push a copy of a variables value onto the stack
+    LOAD_DROP = 3  # Push a variables value onto the stack and drop it
+    STORE = 4  # Pop the top of the stack into a variable
+    POP_DROP = 5  # Pop the top of the stack and discard it
+    DROP = 6  # Drop a variable from memory
+    DECLARE = 7  # Declare a new variable
+    MOVE = 8  # Move a literal value into a variable
+    ADD = 9
+    SUB = 10
+    MUL = 11
+    DIV = 12
+    FDIV = 13
+    POW = 14
+    PRINT = 15  # Pop and print the top of the stack
+    PRINT_VAR = 16  # Print a variables value
+    HALT = 17  # End of the program, checks for leftover data
+    STORE_CONST = 18  # Store a constant directly into a variable
+    # Arithmetic the VM specialized for the operand types it last saw,
+    # the arg is the generic op it replaced and its operator
+    BINARY_INT = 19
+    BINARY_FLOAT = 20
+    BINARY_STR = 21
+    # Control flow, blocks are matched by Program.link which resolves
+    # every jump to the index of the instruction it continues at
+    IF = 22  # Pop a bool, skip past the end of the block when false
+    LOOP = 23  # Pop an int, run the block that many times
+    FOR = 24  # Like loop, counting in a variable the block defines
+    START = 25  # Start of a block run until its end pops a false bool
+    END = 26  # End of a block, before it is linked
+    END_IF = 27
+    END_LOOP = 28  # Jump back to the start of the block if it runs again
+    END_FOR = 29
+    END_START = 30  # Pop a bool, jump back to the start of the block if true
+    RELEASE = 31  # Free a variables value early, it stays defined until dropped
+
+
+OPERATORS: dict[OpCode, t.Callable[[t.Any, t.Any], t.Any]] = {
+    OpCode.ADD: operator.add,
+    OpCode.SUB: operator.sub,
+    OpCode.MUL: operator.mul,
+    OpCode.DIV: operator.truediv,
+    OpCode.FDIV: operator.floordiv,
+    OpCode.POW: operator.pow,
+}
+
+SPECIALIZED = frozenset((OpCode.BINARY_INT, OpCode.BINARY_FLOAT, OpCode.BINARY_STR))
+
+BLOCK_STARTS = frozenset((OpCode.IF, OpCode.LOOP, OpCode.FOR, OpCode.START))
+BLOCK_ENDS = frozenset(
+    (OpCode.END, OpCode.END_IF, OpCode.END_LOOP, OpCode.END_FOR, OpCode.END_START)
+)
+
+
+class Instruction(t.NamedTuple):
+    op: OpCode
+    arg: t.Any = None
+
+
+@dataclass
+class Program:
+    code: list[Instruction] = field(default_factory=list)
+    lines: LineTable = field(default_factory=LineTable)
+    names: list[str] = field(default_factory=list)
+    verified: bool = False
+    # The source the program was compiled from, only read to show the
+    # line an error happened on
+    source: bytes | None = field(default=None, repr=False, compare=False)
+    # The Python function the py engine compiled the program to, False
+    # when it could not be
+    transpiled: t.Any = field(default=None, repr=False, compare=False)
+
+    def __len__(self) -> int:
+        return len(self.code)
+
+    def append(self, instruction: Instruction, line: int) -> None:
+        self.code.append(instruction)
+        self.lines.append(line)
+
+    def link(self) -> Program:
+        # Matches every block with its end and stores the jump targets
+        # in both, so nothing is searched for at runtime. Passes that
+        # move instructions around link the program again.
+        code = self.code
+        blocks: list[int] = []
+
+        for i, (op, arg) in enumerate(code):
+            if op in BLOCK_STARTS:
+                blocks.append(i)
+                continue
+
+            if op not in BLOCK_ENDS:
+                continue
+
+            if not blocks:
+                line = self.lines[i]
+                raise errors.ScryExc(f"Unmatched end, line {line}", line=line)
+
+            start = blocks.pop()
+            start_op, start_arg = code[start]
+
+            if start_op is OpCode.IF:
+                code[start] = Instruction(OpCode.IF, i + 1)
+                code[i] = Instruction(OpCode.END_IF)
+
+            elif start_op is OpCode.LOOP:
+                code[start] = Instruction(OpCode.LOOP, i + 1)
+                code[i] = Instruction(OpCode.END_LOOP, start + 1)
+
+            elif start_op is OpCode.FOR:
+                slot = start_arg[0]
+                code[start] = Instruction(OpCode.FOR, (slot, i + 1))
+                code[i] = Instruction(OpCode.END_FOR, (slot, start + 1))
+
+            else:
+                code[start] = Instruction(OpCode.START, i)
+                code[i] = Instruction(OpCode.END_START, start + 1)
+
+        if blocks:
+            start = blocks[-1]
+            line = self.lines[start]
+            raise errors.ScryExc(
+                f"Unclosed {code[start].op.name.lower()}, line {line} -> missing end",
+                line=line,
+            )
+
+        return self
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import typing as t
+
+# Shorter results are copied, which is faster than keeping both halves
+# around when the strings are small
+MIN_ROPE_LENGTH = 1024
+
+
+class Rope:
+    # A string built by concatenation, kept as the two strings it was
+    # built from until something needs its text. Programs never see the
+    # difference, printing and interpolation convert it like any value.
+    __slots__ = ("_left", "_right", "_length", "_flat")
+
+    def __init__(self, left: str | Rope, right: str | Rope) -> None:
+        self._left = left
+        self._right = right
+        self._length = len(left) + len(right)
+        self._flat: str | None = None
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return self.flatten()
+
+    def __repr__(self) -> str:
+        return f"Rope({self.flatten()!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is str or type(other) is Rope:
+            return self.flatten() == str(other)
+
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.flatten())
+
+    def __mul__(self, other: t.Any) -> str:
+        # Repeating copies anyway, so it is done on the flat string
+        return t.cast(str, self.flatten() * other)
+
+    __rmul__ = __mul__
+
+    def flatten(self) -> str:
+        if self._flat is not None:
+            return self._flat
+
+        # Walked with a list instead of recursion, accumulators build
+        # ropes deeper than the recursion limit
+        parts: list[str] = []
+        pending: list[str | Rope] = [self]
+
+        while pending:
+            node = pending.pop()
+
+            if isinstance(node, str):
+                parts.append(node)
+            elif node._flat is not None:
+                parts.append(node._flat)
+            else:
+                pending.append(node._right)
+                pending.append(node._left)
+
+        self._flat = "".join(parts)
+        # The halves are not needed once the text is known
+        self._left = self._right = ""
+        return self._flat
+
+
+STRINGS = frozenset((str, Rope))
+
+
+def concat(a: t.Any, b: t.Any) -> str | Rope:
+    if type(a) not in STRINGS:
+        a = str(a)
+
+    if type(b) not in STRINGS:
+        b = str(b)
+
+    if len(a) + len(b) < MIN_ROPE_LENGTH:
+        # Ropes are never shorter than this, so both are strings
+        return t.cast(str, a) + t.cast(str, b)
+
+    return Rope(a, b)
+
+
+def kind(value: t.Any) -> type:
+    # The type a variable holding the value has
+    value_type: type = type(value)
+    return str if value_type is Rope else value_type
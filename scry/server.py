@@ -0,0 +1,480 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import multiprocessing
+import os
+import struct
+import threading
+import time
+import typing as t
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from scry import errors
+from scry.interpreter import Interpreter
+from scry.limits import LimitedVM
+from scry.limits import Limits
+from scry.output import BufferedSink
+from scry.output import FlushPolicy
+from scry.program import Program
+
+# Every message is a 4 byte big endian length followed by that many
+# bytes of utf-8 encoded json
+HEADER = struct.Struct("!I")
+MAX_MESSAGE_SIZE = 16 * 2**20
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7878
+DEFAULT_MAX_INSTRUCTIONS = 10_000_000
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_STACK = 1_000_000
+DEFAULT_MAX_INT_BITS = 1_000_000
+DEFAULT_MAX_STRING_LENGTH = 16 * 2**20
+
+# Programs longer than this are run in the worker pool, shorter ones run
+# on the event loop where they finish faster than a round trip would
+INLINE_INSTRUCTIONS = 10_000
+# Short programs can still loop or compute for long, so they only run on
+# the event loop within these limits. Programs that go past them are run
+# again in the worker pool.
+INLINE_LIMITS = Limits(
+    max_instructions=100_000,
+    timeout=0.05,
+    max_int_bits=65_536,
+    max_string_length=2**20,
+)
+# The limits behind each error, a program that went past one the budget
+# lowered might still finish within the limits of its request
+LIMITED_BY = {
+    errors.InstructionLimitExceeded: ("max_instructions",),
+    errors.TimeLimitExceeded: ("timeout",),
+    errors.StackLimitExceeded: ("max_stack",),
+    errors.ValueLimitExceeded: ("max_int_bits", "max_string_length"),
+}
+# Printed output is sent back in chunks of roughly this many characters
+OUTPUT_CHUNK_SIZE = 4096
+
+Message = t.Dict[str, t.Any]
+
+# The types a request may give each limit as
+COUNT = (int,)
+SECONDS = (int, float)
+
+
+class ProtocolError(Exception):
+    ...
+
+
+def encode(message: Message) -> bytes:
+    data = json.dumps(message).encode()
+    return HEADER.pack(len(data)) + data
+
+
+async def read_message(reader: asyncio.StreamReader) -> Message | None:
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ProtocolError("Connection closed in the middle of a message")
+
+        return None
+
+    (size,) = HEADER.unpack(header)
+
+    if size > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"Message of {size} bytes is too large")
+
+    try:
+        message = json.loads(await reader.readexactly(size))
+    except asyncio.IncompleteReadError:
+        raise ProtocolError("Connection closed in the middle of a message")
+    except ValueError as e:
+        raise ProtocolError(f"Message is not valid json -> {e}")
+
+    if not isinstance(message, dict):
+        raise ProtocolError("Message is not a json object")
+
+    return message
+
+
+class ChunkWriter:
+    # The stream behind a BufferedSink, handing each flushed chunk of
+    # output to a callback instead of writing it to a file
+    def __init__(self, send: t.Callable[[t.Optional[str]], None]) -> None:
+        self._send = send
+
+    def write(self, text: str) -> int:
+        self._send(text)
+        return len(text)
+
+    def flush(self) -> None:
+        return None
+
+
+def tighten(limits: Limits, budget: Limits) -> Limits:
+    # The smaller of each limit, where None is no limit at all
+    def smaller(a: t.Any, b: t.Any) -> t.Any:
+        return b if a is None else a if b is None else min(a, b)
+
+    return Limits(
+        *(
+            smaller(getattr(limits, field.name), getattr(budget, field.name))
+            for field in dataclasses.fields(Limits)
+        )
+    )
+
+
+def failure(error: Exception) -> str:
+    if isinstance(error, errors.ScryExc):
+        return str(error)
+
+    return f"{type(error).__name__}: {error}"
+
+
+def execute(
+    program: Program, limits: Limits, send: t.Callable[[t.Optional[str]], None]
+) -> tuple[str | None, int]:
+    output = BufferedSink(ChunkWriter(send), FlushPolicy(OUTPUT_CHUNK_SIZE))
+    vm = LimitedVM(output, limits)
+
+    try:
+        vm.run(program)
+    except Exception as e:
+        return failure(e), vm.executed
+
+    return None, vm.executed
+
+
+def execute_inline(
+    program: Program,
+    limits: Limits,
+    budget: Limits,
+    send: t.Callable[[t.Optional[str]], None],
+) -> tuple[str | None, int] | None:
+    # None when the program went past the budget. Its output is held
+    # back until it finishes, so nothing was sent when it runs again.
+    tightened = tighten(limits, budget)
+    chunks: list[str | None] = []
+    output = BufferedSink(ChunkWriter(chunks.append), FlushPolicy(OUTPUT_CHUNK_SIZE))
+    vm = LimitedVM(output, tightened)
+    error: str | None = None
+
+    try:
+        vm.run(program)
+    except errors.LimitExceeded as e:
+        names = LIMITED_BY.get(type(e), ())
+
+        if any(getattr(tightened, n) != getattr(limits, n) for n in names):
+            return None
+
+        error = failure(e)
+    except Exception as e:
+        error = failure(e)
+
+    for chunk in chunks:
+        send(chunk)
+
+    return error, vm.executed
+
+
+def execute_in_worker(
+    program: Program, limits: Limits, queue: t.Any
+) -> tuple[str | None, int]:
+    # Output goes back through the queue as it is printed, None marks
+    # the end of it
+    try:
+        return execute(program, limits, queue.put)
+    finally:
+        queue.put(None)
+
+
+class Server:
+    def __init__(
+        self,
+        jobs: int | None = None,
+        max_instructions: int | None = DEFAULT_MAX_INSTRUCTIONS,
+        timeout: float | None = DEFAULT_TIMEOUT,
+        max_stack: int | None = DEFAULT_MAX_STACK,
+        max_int_bits: int | None = DEFAULT_MAX_INT_BITS,
+        max_string_length: int | None = DEFAULT_MAX_STRING_LENGTH,
+        inline_instructions: int = INLINE_INSTRUCTIONS,
+        inline_limits: Limits = INLINE_LIMITS,
+        interpreter: Interpreter | None = None,
+    ) -> None:
+        self.jobs = jobs
+        self.limits = Limits(
+            max_instructions, timeout, max_stack, max_int_bits, max_string_length
+        )
+        self.inline_instructions = inline_instructions
+        self.inline_limits = inline_limits
+        # Compiled programs are shared by every request
+        self.interpreter = interpreter or Interpreter(use_cache=False)
+        self._compile_lock = threading.Lock()
+        self._pool: ProcessPoolExecutor | None = None
+        self._manager: t.Any = None
+        # Threads waiting for the output of pooled programs, kept apart
+        # from the default executor the compiles run in
+        self._readers: ThreadPoolExecutor | None = None
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+        if self._readers is not None:
+            self._readers.shutdown()
+            self._readers = None
+
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.jobs)
+            self._manager = multiprocessing.Manager()
+            # One per worker, requests are read in the order they run
+            self._readers = ThreadPoolExecutor(self.jobs or os.cpu_count())
+
+        return self._pool
+
+    def request_limits(self, request: Message) -> Limits:
+        # Requests may tighten the server's limits, never loosen them
+        def pick(requested: t.Any, allowed: t.Any, types: tuple[type, ...]) -> t.Any:
+            if requested is None:
+                return allowed
+
+            # Counts must be whole, or the checks that count down to
+            # them never fire. Bools are ints to isinstance.
+            if (
+                type(requested) is bool
+                or not isinstance(requested, types)
+                or requested < 0
+            ):
+                raise ProtocolError(f"Invalid limit {requested!r}")
+
+            return requested if allowed is None else min(requested, allowed)
+
+        return Limits(
+            pick(request.get("max_instructions"), self.limits.max_instructions, COUNT),
+            pick(request.get("timeout"), self.limits.timeout, SECONDS),
+            pick(request.get("max_stack"), self.limits.max_stack, COUNT),
+            pick(request.get("max_int_bits"), self.limits.max_int_bits, COUNT),
+            pick(
+                request.get("max_string_length"),
+                self.limits.max_string_length,
+                COUNT,
+            ),
+        )
+
+    def compile(self, source: str, name: str) -> Program:
+        with self._compile_lock:
+            return self.interpreter.compile(source, name)
+
+    async def run_in_pool(
+        self, program: Program, limits: Limits, send: t.Callable[[str], None]
+    ) -> tuple[str | None, int]:
+        loop = asyncio.get_running_loop()
+        pool = self.pool()
+        queue = self._manager.Queue()
+        result = loop.run_in_executor(pool, execute_in_worker, program, limits, queue)
+
+        while True:
+            chunk = await loop.run_in_executor(self._readers, queue.get)
+
+            if chunk is None:
+                break
+
+            send(chunk)
+
+        return await result
+
+    async def run(self, request: Message, send: t.Callable[[Message], None]) -> None:
+        request_id = request.get("id")
+        start = time.perf_counter()
+        executed = 0
+
+        def send_output(text: str | None) -> None:
+            if text:
+                send({"id": request_id, "type": "output", "data": text})
+
+        try:
+            source = request.get("source")
+            name = request.get("name", "<request>")
+
+            if not isinstance(source, str) or not isinstance(name, str):
+                raise ProtocolError("Requests need a source string")
+
+            limits = self.request_limits(request)
+            loop = asyncio.get_running_loop()
+            program = await loop.run_in_executor(None, self.compile, source, name)
+
+            finished = None
+
+            if len(program) <= self.inline_instructions:
+                finished = execute_inline(
+                    program, limits, self.inline_limits, send_output
+                )
+
+            if finished is None:
+                finished = await self.run_in_pool(program, limits, send_output)
+
+            error, executed = finished
+
+        except errors.ScryExc as e:
+            error = str(e)
+        except ProtocolError as e:
+            error = f"Invalid request -> {e}"
+        except Exception as e:
+            # The lexer and compiler raise more than ScryExc on some
+            # bad programs, the client still gets its result
+            error = f"{type(e).__name__}: {e}"
+
+        send(
+            {
+                "id": request_id,
+                "type": "result",
+                "ok": error is None,
+                "error": error,
+                "instructions": executed,
+                "seconds": time.perf_counter() - start,
+            }
+        )
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        tasks: set[asyncio.Task[None]] = set()
+
+        def send(message: Message) -> None:
+            if not writer.is_closing():
+                writer.write(encode(message))
+
+        try:
+            while True:
+                try:
+                    request = await read_message(reader)
+                except ProtocolError as e:
+                    send({"type": "error", "error": str(e)})
+                    break
+
+                if request is None:
+                    break
+
+                # Requests on one connection run concurrently, their
+                # messages are told apart by the id they were sent with
+                task = asyncio.ensure_future(self.run(request, send))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                await writer.drain()
+
+            if tasks:
+                await asyncio.gather(*tasks)
+
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            writer.close()
+
+    async def serve(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        path: Path | None = None,
+    ) -> None:
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, str(path))
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(
+        prog="scry serve", description="Run Scry programs sent over a socket."
+    )
+    arg_parser.add_argument(
+        "--socket",
+        type=Path,
+        default=None,
+        help="listen on this unix socket instead of tcp",
+    )
+    arg_parser.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help=f"the address to listen on (default: {DEFAULT_HOST})",
+    )
+    arg_parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"the port to listen on (default: {DEFAULT_PORT})",
+    )
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="how many processes run long programs (default: one per cpu)",
+    )
+    arg_parser.add_argument(
+        "--max-instructions",
+        type=int,
+        default=DEFAULT_MAX_INSTRUCTIONS,
+        help="the most instructions a request may run (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help="the most seconds a request may run for (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--max-stack",
+        type=int,
+        default=DEFAULT_MAX_STACK,
+        help="the most values a request may put on the stack (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--max-int-bits",
+        type=int,
+        default=DEFAULT_MAX_INT_BITS,
+        help="the most bits an int may have (default: %(default)s)",
+    )
+    arg_parser.add_argument(
+        "--max-string-length",
+        type=int,
+        default=DEFAULT_MAX_STRING_LENGTH,
+        help="the most characters a string may have (default: %(default)s)",
+    )
+    return arg_parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> None:
+    args = parse_args(argv)
+    server = Server(
+        args.jobs,
+        args.max_instructions,
+        args.timeout,
+        args.max_stack,
+        args.max_int_bits,
+        args.max_string_length,
+    )
+
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import functools
+import re
+import typing as t
+
+from scry import errors
+from scry.types import UNDEFINED
+from scry.types import Variable
+
+PLACEHOLDER_REGEX = re.compile(r"\$\{([^}]*)\}")
+TEMPLATE_CACHE_SIZE = 4096
+
+
+class Template:
+    __slots__ = ("literal", "chunks", "names")
+
+    def __init__(self, literal: str, chunks: list[str], names: list[str]) -> None:
+        self.literal = literal
+        self.chunks = chunks
+        self.names = names
+
+    def __repr__(self) -> str:
+        return f"Template({self.literal!r})"
+
+    def render(self, state: t.Mapping[str, Variable], line: int) -> str:
+        parts = [self.chunks[0]]
+
+        for name, chunk in zip(self.names, self.chunks[1:]):
+            if name not in state:
+                raise errors.ScryExc(f"Unknown symbol, line {line} -> {name!r}")
+
+            value = state[name].value
+            parts.append(value if isinstance(value, str) else str(value))
+            parts.append(chunk)
+
+        return "".join(parts)
+
+    def render_slots(
+        self,
+        slots: t.Sequence[int],
+        values: t.Sequence[t.Any],
+        line: t.Callable[[], int],
+    ) -> str:
+        # The line is only looked up when a variable is missing
+        parts = [self.chunks[0]]
+
+        for name, slot, chunk in zip(self.names, slots, self.chunks[1:]):
+            value = values[slot]
+
+            if value is UNDEFINED:
+                raise errors.ScryExc(f"Unknown symbol, line {line()} -> {name!r}")
+
+            parts.append(value if isinstance(value, str) else str(value))
+            parts.append(chunk)
+
+        return "".join(parts)
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(literal: str) -> Template:
+    chunks: list[str] = []
+    names: list[str] = []
+    start = 0
+
+    for match in PLACEHOLDER_REGEX.finditer(literal):
+        chunks.append(literal[start : match.start()])
+        names.append(match.group(1))
+        start = match.end()
+
+    chunks.append(literal[start:])
+    return Template(literal, chunks, names)
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
+import array
 import enum
 import typing as t
-from dataclasses import dataclass
 
 KEYWORDS = (
     "push",  # Push a variable or literal onto the stack, cloning the variable (stack1)
@@ -18,11 +18,11 @@ KEYWORDS = (
     "var",  # Create a new variable, requires a type and name
     "//",  # Floor divide
     "in",  # TODO: implement me
-    "if",  # TODO: implement me
-    "loop",  # TODO: implement me
-    "for",  # TODO: implement me
-    "end",  # TODO: implement me
-    "start",  # TODO: implement me
+    "if",  # Pop a bool, the block up to its end only runs when it is true
+    "loop",  # Pop an int, the block up to its end runs that many times
+    "for",  # Like loop, the variable it names counts up from 0 in the block
+    "end",  # Ends a block, after start it pops a bool and repeats if true
+    "start",  # Starts a block that runs at least once, see end
     "funk",  # TODO: implement me - maybe?
     "int",  # Integer whole numbers
     "string",  # String of characters
@@ -54,10 +54,99 @@ class TokenType(enum.Enum):
     DROP = 14
     PUSHD = 15
     EOF = 16
+    IF = 17
+    LOOP = 18
+    FOR = 19
+    START = 20
+    END = 21
+
+
+TOKEN_TYPES = {token_type.value: token_type for token_type in TokenType}
 
 
-@dataclass
 class Token:
-    token_type: TokenType
-    line: int
-    value: t.Any = None
+    __slots__ = ("token_type", "line", "value")
+
+    def __init__(self, token_type: TokenType, line: int, value: t.Any = None) -> None:
+        self.token_type = token_type
+        self.line = line
+        self.value = value
+
+    def __repr__(self) -> str:
+        return (
+            f"Token(token_type={self.token_type!r}, "
+            f"line={self.line!r}, value={self.value!r})"
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Token):
+            return NotImplemented
+
+        return (self.token_type, self.line, self.value) == (
+            other.token_type,
+            other.line,
+            other.value,
+        )
+
+
+# Token types and lines are packed into typed arrays and values are
+# deduplicated into a shared pool, so a buffered token costs a handful
+# of bytes instead of a full object. Token objects are built on demand.
+class TokenBuffer:
+    __slots__ = ("types", "lines", "values", "pool", "_pool_index")
+
+    def __init__(self) -> None:
+        self.types = array.array("B")
+        self.lines = array.array("I")
+        self.values = array.array("I")
+        self.pool: list[t.Any] = [None]
+        self._pool_index: dict[t.Any, int] = {None: 0}
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __iter__(self) -> t.Iterator[Token]:
+        pool = self.pool
+
+        for token_type, line, value in zip(self.types, self.lines, self.values):
+            yield Token(TOKEN_TYPES[token_type], line, pool[value])
+
+    def __getitem__(self, index: int) -> Token:
+        return Token(
+            TOKEN_TYPES[self.types[index]],
+            self.lines[index],
+            self.pool[self.values[index]],
+        )
+
+    def __repr__(self) -> str:
+        return f"TokenBuffer({len(self)} tokens)"
+
+    def intern(self, value: t.Any) -> int:
+        index = self._pool_index.get(value)
+
+        if index is None:
+            index = self._pool_index[value] = len(self.pool)
+            self.pool.append(value)
+
+        return index
+
+    def append(self, token: Token) -> None:
+        self.types.append(token.token_type.value)
+        self.lines.append(token.line)
+        self.values.append(self.intern(token.value))
+
+    def extend(self, tokens: t.Iterable[Token]) -> None:
+        for token in tokens:
+            self.append(token)
+
+    def extend_buffer(self, other: TokenBuffer) -> None:
+        # Pool indexes only mean something within their own buffer, so
+        # the other buffer's values are interned into this one's pool
+        remap = [self.intern(value) for value in other.pool]
+        self.types.extend(other.types)
+        self.lines.extend(other.lines)
+
+        if remap == list(range(len(remap))):
+            self.values.extend(other.values)
+        else:
+            self.values.extend(map(remap.__getitem__, other.values))
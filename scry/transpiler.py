@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import ast
+import typing as t
+
+from scry import errors
+from scry import positions
+from scry.output import OutputSink
+from scry.program import OPERATORS
+from scry.program import SPECIALIZED
+from scry.program import OpCode
+from scry.program import Program
+from scry.ropes import concat
+from scry.templates import Template
+from scry.verifier import TypeSet
+from scry.verifier import Verifier
+
+# Larger programs are left to the VM, compiling them to Python takes
+# longer and more memory than running them does
+MAX_INSTRUCTIONS = 250_000
+
+Function = t.Callable[[t.Callable[[t.Any], None]], None]
+
+SYMBOLS = {
+    OpCode.ADD: "+",
+    OpCode.SUB: "-",
+    OpCode.MUL: "*",
+    OpCode.DIV: "/",
+    OpCode.FDIV: "//",
+    OpCode.POW: "**",
+}
+
+# How many values each op pushes onto the stack, negative for popping
+STACK_EFFECTS = {
+    OpCode.PUSH: 1,
+    OpCode.PUSH_STRING: 1,
+    OpCode.LOAD: 1,
+    OpCode.LOAD_DROP: 1,
+    OpCode.STORE: -1,
+    OpCode.POP_DROP: -1,
+    OpCode.PRINT: -1,
+    OpCode.IF: -1,
+    OpCode.LOOP: -1,
+    OpCode.FOR: -1,
+    OpCode.END_START: -1,
+    **{op: -1 for op in OPERATORS},
+    **{op: -1 for op in SPECIALIZED},
+}
+
+# Operands that can not make an operator raise a TypeError, so it runs
+# as plain Python arithmetic
+REAL = frozenset((int, float))
+STRING = frozenset((str,))
+
+
+def binary(func: t.Callable[[t.Any, t.Any], t.Any], a: t.Any, b: t.Any) -> t.Any:
+    try:
+        return func(a, b)
+    except TypeError:
+        return concat(a, b)
+
+
+def escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+class TypeRecorder(Verifier):
+    # Verifies the program while keeping the types the transpiler can
+    # generate faster code for
+    def __init__(self) -> None:
+        super().__init__()
+        self.operands: dict[int, tuple[TypeSet, TypeSet]] = {}
+        self.kinds: dict[int, type] = {}
+
+    def binary_rule(self, op: OpCode) -> t.Callable[[None], None]:
+        rule = super().binary_rule(op)
+
+        def recorded(_: None) -> None:
+            # Loops are checked until their types settle, so the last
+            # pass over an instruction saw every type it can get
+            if len(self._stack) > 1:
+                self.operands[self._ip - 1] = (self._stack[-1], self._stack[-2])
+
+            rule(None)
+
+        return recorded
+
+    def verify_move(self, arg: tuple[int, str, Template, tuple[int, ...]]) -> None:
+        super().verify_move(arg)
+        kind = self.lookup(arg[0]).kind
+
+        # Moves only verify into variables with a single type
+        if kind is not None:
+            (self.kinds[self._ip - 1],) = kind
+
+
+class Transpiler:
+    def __init__(self, program: Program) -> None:
+        self.program = program
+        self.types = TypeRecorder()
+        # Python source, one statement per line, and the Scry line each
+        # statement came from
+        self.source: list[str] = []
+        self.lines: list[int] = []
+        self.constants: list[t.Any] = []
+        self.indent = 1
+        # How many statements each open block has so far
+        self.blocks: list[int] = []
+
+    def emit(self, statement: str, line: int) -> None:
+        self.source.append("    " * self.indent + statement)
+        self.lines.append(line)
+
+        if self.blocks:
+            self.blocks[-1] += 1
+
+    def constant(self, value: t.Any) -> str:
+        self.constants.append(value)
+        return f"k{len(self.constants) - 1}"
+
+    def open(self, statement: str, line: int) -> None:
+        self.emit(statement, line)
+        self.blocks.append(0)
+        self.indent += 1
+
+    def close(self, line: int) -> None:
+        if not self.blocks[-1]:
+            self.emit("pass", line)
+
+        self.blocks.pop()
+        self.indent -= 1
+
+    def render(self, template: Template, slots: tuple[int, ...]) -> str:
+        # Interpolation becomes an f-string
+        text = escape(template.chunks[0])
+
+        for slot, chunk in zip(slots, template.chunks[1:]):
+            text += f"{{v{slot}}}{escape(chunk)}"
+
+        return "f" + repr(text)
+
+    def translate(self) -> str:
+        depth = 0
+        recorded = self.types.operands
+
+        for ip, ((op, arg), line) in enumerate(
+            zip(self.program.code, self.program.lines)
+        ):
+            top = f"s{depth - 1}"
+            below = f"s{depth - 2}"
+            pushed = f"s{depth}"
+
+            if op in SPECIALIZED:
+                op = arg[0]
+
+            if op is OpCode.PUSH:
+                self.emit(f"{pushed} = {self.constant(arg)}", line)
+
+            elif op is OpCode.PUSH_STRING:
+                self.emit(f"{pushed} = {self.render(*arg)}", line)
+
+            elif op in (OpCode.LOAD, OpCode.LOAD_DROP):
+                self.emit(f"{pushed} = v{arg}", line)
+
+            elif op is OpCode.STORE:
+                self.emit(f"v{arg} = {top}", line)
+
+            elif op is OpCode.STORE_CONST:
+                self.emit(f"v{arg[0]} = {self.constant(arg[1])}", line)
+
+            elif op in (OpCode.DROP, OpCode.RELEASE, OpCode.DECLARE):
+                slot = arg[0] if op is OpCode.DECLARE else arg
+                self.emit(f"v{slot} = None", line)
+
+            elif op is OpCode.MOVE:
+                slot, value, template, slots = arg
+                kind = self.types.kinds[ip]
+
+                if kind is str:
+                    self.emit(f"v{slot} = {self.render(template, slots)}", line)
+                else:
+                    # Values that fail to convert raise when the move
+                    # runs, like they do on the VM
+                    try:
+                        converted = self.constant(kind(value))
+                    except Exception:
+                        converted = f"{kind.__name__}({self.constant(value)})"
+
+                    self.emit(f"v{slot} = {converted}", line)
+
+            elif op in OPERATORS:
+                a, b = recorded.get(ip, (None, None))
+
+                if a is not None and b is not None and a | b <= REAL:
+                    self.emit(f"{below} = {top} {SYMBOLS[op]} {below}", line)
+                elif a == STRING and b == STRING:
+                    self.emit(f"{below} = concat({top}, {below})", line)
+                else:
+                    self.emit(f"{below} = binary({op.name}, {top}, {below})", line)
+
+            elif op is OpCode.PRINT:
+                self.emit(f"write({top})", line)
+
+            elif op is OpCode.PRINT_VAR:
+                self.emit(f"write(v{arg})", line)
+
+            elif op is OpCode.IF:
+                self.open(f"if {top}:", line)
+
+            elif op is OpCode.LOOP:
+                self.open(f"for _ in range({top}):", line)
+
+            elif op is OpCode.FOR:
+                self.open(f"for v{arg[0]} in range({top}):", line)
+
+            elif op is OpCode.START:
+                self.open("while True:", line)
+
+            elif op is OpCode.END_START:
+                self.emit(f"if not {top}: break", line)
+                self.close(line)
+
+            elif op in (OpCode.END_IF, OpCode.END_LOOP, OpCode.END_FOR):
+                self.close(line)
+
+            depth += STACK_EFFECTS.get(op, 0)
+
+        self.source.insert(0, "def program(write):")
+        self.lines.insert(0, 1)
+        self.emit("return None", self.program.lines[-1] if self.program.lines else 1)
+        return "\n".join(self.source)
+
+    def compile(self, name: str) -> Function | None:
+        if len(self.program) > MAX_INSTRUCTIONS:
+            return None
+
+        # Only verified programs are known to use the stack the same way
+        # every time they run, so its slots can become locals
+        if not self.types.verify(self.program):
+            return None
+
+        try:
+            tree = ast.parse(self.translate())
+            Relocate(self.lines, self.constants).visit(tree)
+            code = compile(tree, name, "exec")
+        except (SyntaxError, RecursionError, MemoryError, ValueError):
+            # Python limits things Scry does not, like block nesting
+            return None
+
+        namespace: dict[str, t.Any] = {"binary": binary, "concat": concat}
+        namespace.update({op.name: func for op, func in OPERATORS.items()})
+        exec(code, namespace)
+        return t.cast(Function, namespace["program"])
+
+
+class Relocate(ast.NodeTransformer):
+    # Moves every node to the Scry line its statement came from, so
+    # tracebacks point into the program, and puts the constants in
+    # place of their names
+    def __init__(self, lines: list[int], constants: list[t.Any]) -> None:
+        self.lines = lines
+        self.constants = constants
+
+    def visit(self, node: ast.AST) -> t.Any:
+        if hasattr(node, "lineno"):
+            line = self.lines[node.lineno - 1]
+            node.lineno = node.end_lineno = line
+            # Columns of the generated code mean nothing in the program
+            node.col_offset = node.end_col_offset = 0
+
+        return super().visit(node)
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id[0] == "k" and node.id[1:].isdigit():
+            constant = ast.Constant(self.constants[int(node.id[1:])])
+            return ast.copy_location(constant, node)
+
+        return node
+
+
+def transpile(program: Program, name: str = "<program>") -> Function | None:
+    # The function is kept with the program, so programs the
+    # interpreter caches are only ever transpiled once
+    if program.transpiled is None:
+        try:
+            program.transpiled = Transpiler(program).compile(name) or False
+        except errors.ScryExc as e:
+            # Programs built with --no-verify are first verified here,
+            # their errors point into the program like the VM's do
+            positions.locate(e, program.source)
+            raise
+
+    return program.transpiled or None
+
+
+def run(function: Function, output: OutputSink) -> None:
+    try:
+        function(output.write_line)
+    finally:
+        output.flush()
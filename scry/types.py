@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import typing as t
-from dataclasses import dataclass
 from enum import Enum
 
 
@@ -14,9 +13,30 @@ class Type(Enum):
     UFLOAT = 5
 
 
-@dataclass
+# Marks a variable slot that is not currently defined
+UNDEFINED: t.Any = object()
+
+TYPE_NAMES: dict[str, Type] = {
+    "int": Type.INT,
+    "string": Type.STRING,
+    "bool": Type.BOOL,
+    "uint": Type.UINT,
+    "float": Type.FLOAT,
+    "ufloat": Type.UFLOAT,
+}
+
+
 class Variable:
-    name: str
-    type: t.Any
-    line: int
-    value: t.Any = None
+    __slots__ = ("name", "type", "line", "value")
+
+    def __init__(self, name: str, type: t.Any, line: int, value: t.Any = None) -> None:
+        self.name = name
+        self.type = type
+        self.line = line
+        self.value = value
+
+    def __repr__(self) -> str:
+        return (
+            f"Variable(name={self.name!r}, type={self.type!r}, "
+            f"line={self.line!r}, value={self.value!r})"
+        )
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import typing as t
+
+from scry import errors
+from scry import templates
+from scry.types import Type
+from scry.types import Variable
+
+
+def convert_literal(type_: Type, value: str, line: int) -> t.Any:
+    if type_ in (Type.INT, Type.UINT):
+        if "." in value:
+            raise errors.ScryExc(
+                f"Value incompatible with type, line {line} -> {value!r}"
+            )
+
+        iconverted = int(value)
+
+        if type_ is Type.UINT and iconverted < 0:
+            raise errors.ScryExc(
+                f"Unsigned int can not be negative, line {line} -> {value!r}"
+            )
+
+        return iconverted
+
+    if type_ in (Type.FLOAT, Type.UFLOAT):
+        fconverted = float(value)
+
+        if type_ is Type.UFLOAT and fconverted < 0:
+            raise errors.ScryExc(
+                f"Unsigned float can not be negative, line {line} -> {value!r}"
+            )
+
+        return fconverted
+
+    if type_ is Type.BOOL:
+        string = value.lower()
+
+        if string == "true":
+            return True
+
+        if string == "false":
+            return False
+
+        raise errors.ScryExc(f"Invalid boolean value, line {line} -> {string!r}")
+
+    raise errors.ScryExc(f"Failed to parse types, line {line}")
+
+
+def check_string_literal(value: str, line: int) -> None:
+    if not value.startswith('"'):
+        raise errors.ScryExc(f'Missing opening `"`, line {line}')
+
+    if not value.endswith('"'):
+        raise errors.ScryExc(f'Missing closing `"`, line {line}')
+
+
+def interpolate(value: str, state: t.Mapping[str, Variable], line: int) -> str:
+    return templates.compile_template(value[1:-1]).render(state, line)
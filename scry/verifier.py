@@ -0,0 +1,438 @@
+from __future__ import annotations
+
+import typing as t
+from dataclasses import dataclass
+
+from scry import errors
+from scry import liveness
+from scry import values
+from scry.program import OPERATORS
+from scry.program import SPECIALIZED
+from scry.program import OpCode
+from scry.program import Program
+from scry.templates import Template
+
+# The set of types a value may have at runtime, None when unknown
+TypeSet = t.Optional[t.FrozenSet[type]]
+
+NUMBERS = (int, float, complex)
+CONVERTIBLE = (int, bool, float, complex)
+
+# How many times a loop is checked again with the types its previous
+# pass ended with, before the verifier gives up on finding the types
+# it settles on
+MAX_LOOP_PASSES = 16
+
+
+# Raised when the program can not be proven safe statically
+class Unverifiable(Exception):
+    ...
+
+
+@dataclass
+class Slot:
+    kind: TypeSet
+    line: int
+    value: TypeSet
+
+
+# The stack and variables at some point in the program
+State = t.Tuple[t.List[TypeSet], t.Dict[int, Slot]]
+
+
+def union(a: TypeSet, b: TypeSet) -> TypeSet:
+    if a is None or b is None:
+        return None
+
+    return a | b
+
+
+def copy_state(state: State) -> State:
+    stack, slots = state
+    return list(stack), {s: Slot(v.kind, v.line, v.value) for s, v in slots.items()}
+
+
+def merge(a: State, b: State) -> State:
+    # The state after taking either of two paths through a block
+    (a_stack, a_slots), (b_stack, b_slots) = a, b
+
+    if len(a_stack) != len(b_stack) or a_slots.keys() != b_slots.keys():
+        raise Unverifiable
+
+    stack = [union(x, y) for x, y in zip(a_stack, b_stack)]
+    slots = {
+        slot: Slot(
+            union(v.kind, b_slots[slot].kind),
+            v.line,
+            union(v.value, b_slots[slot].value),
+        )
+        for slot, v in a_slots.items()
+    }
+    return stack, slots
+
+
+def same(a: State, b: State) -> bool:
+    return a[0] == b[0] and all(
+        (v.kind, v.value) == (b[1][slot].kind, b[1][slot].value)
+        for slot, v in a[1].items()
+    )
+
+
+def widest(a: type, b: type) -> type:
+    return a if NUMBERS.index(a) > NUMBERS.index(b) else b
+
+
+def binary_result(op: OpCode, a: type, b: type) -> set[type]:
+    if a not in NUMBERS or b not in NUMBERS:
+        # Any operation involving strings or None either produces a
+        # string or falls back to string concatenation
+        return {str}
+
+    if op is OpCode.DIV:
+        return {complex if complex in (a, b) else float}
+
+    if op is OpCode.FDIV and complex in (a, b):
+        return {str}
+
+    if op is OpCode.POW:
+        if a is int and b is int:
+            return {int, float}
+
+        if complex not in (a, b):
+            return {float, complex}
+
+    return {widest(a, b)}
+
+
+class Verifier:
+    def __init__(self) -> None:
+        self._stack: list[TypeSet] = []
+        self._state: dict[int, Slot] = {}
+        self._program = Program()
+        self._names: list[str] = []
+        self._line = 0
+        self._ip = 0
+        # The state at the start of each running loop and the state
+        # each if continues with when it is skipped, by the index of
+        # the end of their block
+        self._heads: dict[int, State] = {}
+        self._passes: dict[int, int] = {}
+        self._skipped: dict[int, State] = {}
+        # How many blocks the instruction being checked is in
+        self._depth = 0
+        self._rules: dict[OpCode, t.Callable[[t.Any], None]] = {
+            OpCode.PUSH: self.verify_push,
+            OpCode.PUSH_STRING: self.verify_push_string,
+            OpCode.LOAD: self.verify_load,
+            OpCode.LOAD_DROP: self.verify_load_drop,
+            OpCode.STORE: self.verify_store,
+            OpCode.STORE_CONST: self.verify_store_const,
+            OpCode.POP_DROP: self.verify_pop_drop,
+            OpCode.DROP: self.verify_drop,
+            OpCode.DECLARE: self.verify_declare,
+            OpCode.MOVE: self.verify_move,
+            OpCode.PRINT: self.verify_print,
+            OpCode.PRINT_VAR: self.verify_print_var,
+            OpCode.HALT: self.verify_halt,
+            OpCode.IF: self.verify_if,
+            OpCode.LOOP: self.verify_loop,
+            OpCode.FOR: self.verify_for,
+            OpCode.START: self.verify_start,
+            OpCode.END_IF: self.verify_end_if,
+            OpCode.END_LOOP: self.verify_end_loop,
+            OpCode.END_FOR: self.verify_end_for,
+            OpCode.END_START: self.verify_end_start,
+            OpCode.RELEASE: self.verify_release,
+        }
+
+        for op in OPERATORS:
+            self._rules[op] = self.binary_rule(op)
+
+        for op in SPECIALIZED:
+            self._rules[op] = self.verify_specialized
+
+    def verify(self, program: Program) -> bool:
+        self._stack = []
+        self._state = {}
+        self._program = program
+        self._names = program.names
+        self._heads = {}
+        self._passes = {}
+        self._skipped = {}
+        self._depth = 0
+        self._ip = 0
+        code = program.code
+        lines = list(program.lines)
+
+        try:
+            while self._ip < len(code):
+                op, arg = code[self._ip]
+                self._line = lines[self._ip]
+                self._ip += 1
+
+                try:
+                    self._rules[op](arg)
+                except errors.ScryExc as e:
+                    # Blocks might never run, so errors in them are
+                    # left for the runtime to report if they happen
+                    if self._depth:
+                        raise Unverifiable from None
+
+                    if e.line is None:
+                        e.line = self._line
+
+                    raise
+        except Unverifiable:
+            program.verified = False
+        else:
+            program.verified = True
+
+        return program.verified
+
+    def save(self) -> State:
+        return copy_state((self._stack, self._state))
+
+    def restore(self, state: State) -> None:
+        self._stack, self._state = copy_state(state)
+
+    def lookup(self, slot: int) -> Slot:
+        if slot not in self._state:
+            raise errors.ScryExc(
+                f"Unknown variable, line {self._line} -> {self._names[slot]!r}"
+            )
+
+        return self._state[slot]
+
+    def pop(self) -> TypeSet:
+        if not self._stack:
+            raise errors.ScryExc(f"Not enough data on the stack, line {self._line}")
+
+        return self._stack.pop()
+
+    def verify_template(self, template: Template, slots: tuple[int, ...]) -> None:
+        for name, slot in zip(template.names, slots):
+            if slot not in self._state:
+                raise errors.ScryExc(f"Unknown symbol, line {self._line} -> {name!r}")
+
+    def verify_push(self, value: t.Any) -> None:
+        self._stack.append(frozenset((type(value),)))
+
+    def verify_push_string(self, arg: tuple[Template, tuple[int, ...]]) -> None:
+        self.verify_template(*arg)
+        self._stack.append(frozenset((str,)))
+
+    def verify_load(self, slot: int) -> None:
+        self._stack.append(self.lookup(slot).value)
+
+    def verify_load_drop(self, slot: int) -> None:
+        self._stack.append(self.lookup(slot).value)
+        del self._state[slot]
+
+    def verify_store(self, slot: int) -> None:
+        value = self.pop()
+        self.lookup(slot)
+        self._state[slot] = Slot(value, self._line, value)
+
+    def verify_store_const(self, arg: tuple[int, t.Any]) -> None:
+        slot, value = arg
+        self.lookup(slot)
+        kind = frozenset((type(value),))
+        self._state[slot] = Slot(kind, self._line, kind)
+
+    def verify_pop_drop(self, _: None) -> None:
+        self.pop()
+
+    def verify_drop(self, slot: int) -> None:
+        self.lookup(slot)
+        del self._state[slot]
+
+    def verify_release(self, slot: int) -> None:
+        self.lookup(slot).value = frozenset((type(None),))
+
+    def verify_declare(self, arg: tuple[int, type]) -> None:
+        slot, variable_type = arg
+
+        if slot in self._state:
+            raise errors.ScryExc(
+                f"Cannot redefine, line {self._line} "
+                f"-> {self._names[slot]!r} is already defined"
+            )
+
+        kind = frozenset((variable_type,))
+        self._state[slot] = Slot(kind, self._line, frozenset((type(None),)))
+
+    def verify_move(self, arg: tuple[int, str, Template, tuple[int, ...]]) -> None:
+        slot, value, template, slots = arg
+        variable = self.lookup(slot)
+
+        if variable.kind is None or len(variable.kind) != 1:
+            raise Unverifiable
+
+        (kind,) = variable.kind
+
+        if kind is str:
+            values.check_string_literal(value, self._line)
+            self.verify_template(template, slots)
+
+        elif kind not in CONVERTIBLE:
+            raise Unverifiable
+
+        variable.value = variable.kind
+
+    def binary_rule(self, op: OpCode) -> t.Callable[[None], None]:
+        def rule(_: None) -> None:
+            if len(self._stack) < 2:
+                raise errors.ScryExc(
+                    f"Not enough data on the stack, line {self._line} "
+                )
+
+            a = self._stack.pop()
+            b = self._stack.pop()
+
+            if a is None or b is None:
+                raise Unverifiable
+
+            if a == {bool} or b == {bool}:
+                raise errors.ScryExc(
+                    f"Cannot perform basic ops on bools, line {self._line}"
+                )
+
+            if bool in a or bool in b:
+                raise Unverifiable
+
+            result: set[type] = set()
+
+            for a_type in a:
+                for b_type in b:
+                    result.update(binary_result(op, a_type, b_type))
+
+            self._stack.append(frozenset(result))
+
+        return rule
+
+    def verify_specialized(self, arg: tuple[OpCode, t.Any]) -> None:
+        # Programs that already ran may contain specialized arithmetic,
+        # which is checked as the generic op it replaced
+        self._rules[arg[0]](None)
+
+    def pop_typed(self, kind: type, message: str) -> None:
+        value = self.pop()
+
+        if value is None:
+            raise Unverifiable
+
+        if kind not in value:
+            raise errors.ScryExc(f"{message}, line {self._line}")
+
+        if value != {kind}:
+            raise Unverifiable
+
+    def enter(self, end: int) -> None:
+        self._heads[end] = self.save()
+        self._passes[end] = 0
+        self._depth += 1
+
+    def repeat(self, target: int) -> bool:
+        # The end of a loop is reached with the types one pass through
+        # it produced. Passes are checked again with the types merged
+        # into the state the loop started with, until they stop
+        # changing. Returns whether the loop is done.
+        end = self._ip - 1
+        head = self._heads[end]
+        merged = merge(head, self.save())
+
+        if same(merged, head):
+            self.restore(merged)
+            del self._heads[end]
+            self._depth -= 1
+            return True
+
+        self._passes[end] += 1
+
+        if self._passes[end] > MAX_LOOP_PASSES:
+            raise Unverifiable
+
+        self._heads[end] = merged
+        self.restore(merged)
+        self._ip = target
+        return False
+
+    def verify_if(self, target: int) -> None:
+        self.pop_typed(bool, "If requires a bool")
+        self._skipped[target - 1] = self.save()
+        self._depth += 1
+
+    def verify_end_if(self, _: None) -> None:
+        self.restore(merge(self._skipped.pop(self._ip - 1), self.save()))
+        self._depth -= 1
+
+    def verify_loop(self, target: int) -> None:
+        self.pop_typed(int, "Loop count must be an int")
+        self.enter(target - 1)
+
+    def verify_end_loop(self, target: int) -> None:
+        self.repeat(target)
+
+    def verify_for(self, arg: tuple[int, int]) -> None:
+        slot, target = arg
+        self.pop_typed(int, "Loop count must be an int")
+
+        if slot in self._state:
+            raise errors.ScryExc(
+                f"Cannot redefine, line {self._line} "
+                f"-> {self._names[slot]!r} is already defined"
+            )
+
+        kind = frozenset((int,))
+        self._state[slot] = Slot(kind, self._line, kind)
+        self.enter(target - 1)
+
+    def verify_end_for(self, arg: tuple[int, int]) -> None:
+        slot, target = arg
+        variable = self.lookup(slot)
+        # Every pass starts with the variable set to the next count
+        variable.kind = variable.value = frozenset((int,))
+
+        if self.repeat(target):
+            del self._state[slot]
+
+    def verify_start(self, end: int) -> None:
+        self.enter(end)
+
+    def verify_end_start(self, target: int) -> None:
+        self.pop_typed(bool, "End of start requires a bool")
+        self.repeat(target)
+
+    def verify_print(self, _: None) -> None:
+        if not self._stack:
+            raise errors.ScryExc(
+                f"Failed to print, line {self._line} -> Not enough data on the stack"
+            )
+
+        self._stack.pop()
+
+    def verify_print_var(self, slot: int) -> None:
+        if slot not in self._state:
+            raise errors.ScryExc(
+                f"Unknown variable, line {self._line} -> "
+                f"{self._names[slot]!r} is an unknown variable"
+            )
+
+    def verify_halt(self, _: None) -> None:
+        if self._stack:
+            raise errors.ScryExc(
+                f"Unhandled data on the stack, line {self._line} "
+                f"-> {len(self._stack)} items"
+            )
+
+        if self._state:
+            # Liveness knows where each of them was last used
+            described = liveness.undropped(self._program)
+            raise errors.ScryExc(
+                "Variables not dropped: %s"
+                % ", ".join(
+                    described.get(slot, f"line {v.line} -> {self._names[slot]!r}")
+                    for slot, v in self._state.items()
+                ),
+                line=min(v.line for v in self._state.values()),
+            )
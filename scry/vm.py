@@ -0,0 +1,578 @@
+from __future__ import annotations
+
+import functools
+import typing as t
+
+from scry import errors
+from scry import liveness
+from scry import positions
+from scry import values
+from scry.output import BufferedSink
+from scry.output import OutputSink
+from scry.positions import LineTable
+from scry.program import BLOCK_ENDS
+from scry.program import BLOCK_STARTS
+from scry.program import OPERATORS
+from scry.program import Instruction
+from scry.program import OpCode
+from scry.program import Program
+from scry.ropes import STRINGS
+from scry.ropes import Rope
+from scry.ropes import concat
+from scry.templates import Template
+from scry.types import UNDEFINED
+
+Handler = t.Callable[[t.Any], None]
+Operator = t.Callable[[t.Any, t.Any], t.Any]
+BoundTemplate = t.Tuple[Template, t.Tuple[int, ...]]
+Specialized = t.Tuple[OpCode, Operator]
+
+STREAM_CHUNK = 64
+
+# Arithmetic sites are rewritten to these once they see matching
+# operands
+SPECIALIZATIONS: dict[tuple[type, type], OpCode] = {
+    (int, int): OpCode.BINARY_INT,
+    (float, float): OpCode.BINARY_FLOAT,
+    (str, str): OpCode.BINARY_STR,
+    (Rope, str): OpCode.BINARY_STR,
+    (str, Rope): OpCode.BINARY_STR,
+    (Rope, Rope): OpCode.BINARY_STR,
+}
+
+
+class VM:
+    def __init__(self, output: OutputSink | None = None) -> None:
+        self.output = BufferedSink() if output is None else output
+        self._write = self.output.write_line
+        self._stack: list[t.Any] = []
+        self._program = Program()
+        self._code: list[Instruction] = []
+        self._lines = LineTable()
+        self._ip = 0
+
+        # Variables live in flat lists indexed by the slot the compiler
+        # resolved their name to. Types are only consulted by move, and
+        # the instruction that defined a variable and the line table it
+        # belongs to only for error reporting.
+        self._names: list[str] = []
+        self._values: list[t.Any] = []
+        self._types: list[type] = []
+        self._defined_on: list[int] = []
+        self._defined_in: list[LineTable] = []
+        self._defined: dict[int, None] = {}
+        # The iteration and the iteration count of each running loop
+        self._loops: list[list[int]] = []
+
+        table: dict[OpCode, Handler] = {
+            OpCode.PUSH: self._stack.append,
+            OpCode.PUSH_STRING: self.op_push_string,
+            OpCode.LOAD: self.op_load,
+            OpCode.LOAD_DROP: self.op_load_drop,
+            OpCode.STORE: self.op_store,
+            OpCode.STORE_CONST: self.op_store_const,
+            OpCode.POP_DROP: self.op_pop_drop,
+            OpCode.DROP: self.op_drop,
+            OpCode.DECLARE: self.op_declare,
+            OpCode.MOVE: self.op_move,
+            OpCode.PRINT: self.op_print,
+            OpCode.PRINT_VAR: self.op_print_var,
+            OpCode.HALT: self.op_halt,
+            OpCode.BINARY_INT: self.op_binary_int,
+            OpCode.BINARY_FLOAT: self.op_binary_float,
+            OpCode.BINARY_STR: self.op_binary_str,
+            OpCode.IF: self.op_if,
+            OpCode.LOOP: self.op_loop,
+            OpCode.FOR: self.op_for,
+            OpCode.START: self.op_nothing,
+            OpCode.END: self.op_end,
+            OpCode.END_IF: self.op_nothing,
+            OpCode.END_LOOP: self.op_end_loop,
+            OpCode.END_FOR: self.op_end_for,
+            OpCode.END_START: self.op_end_start,
+            OpCode.RELEASE: self.op_release,
+        }
+
+        for op, func in OPERATORS.items():
+            table[op] = functools.partial(self.op_basic, op, func)
+
+        self._handlers: list[Handler] = [table[op] for op in OpCode]
+
+        # Verified programs can not fail these checks, so they run
+        # handlers that skip them
+        table.update(
+            {
+                OpCode.LOAD: self.op_load_unchecked,
+                OpCode.LOAD_DROP: self.op_load_drop_unchecked,
+                OpCode.STORE: self.op_store_unchecked,
+                OpCode.STORE_CONST: self.op_store_const_unchecked,
+                OpCode.POP_DROP: self.op_pop_drop_unchecked,
+                OpCode.DROP: self.op_drop_unchecked,
+                OpCode.DECLARE: self.op_declare_unchecked,
+                OpCode.PRINT: self.op_print_unchecked,
+                OpCode.PRINT_VAR: self.op_print_var_unchecked,
+                OpCode.HALT: self.op_halt_unchecked,
+                OpCode.IF: self.op_if_unchecked,
+                OpCode.LOOP: self.op_loop_unchecked,
+                OpCode.FOR: self.op_for_unchecked,
+                OpCode.END_FOR: self.op_end_for_unchecked,
+                OpCode.END_START: self.op_end_start_unchecked,
+                OpCode.RELEASE: self.op_release_unchecked,
+            }
+        )
+
+        for op, func in OPERATORS.items():
+            table[op] = functools.partial(self.op_basic_unchecked, op, func)
+
+        self._unchecked_handlers: list[Handler] = [table[op] for op in OpCode]
+        self._dispatch = self._handlers
+
+    @property
+    def line(self) -> int:
+        return self.current_line()
+
+    def current_line(self) -> int:
+        # Walks the line table, so only called once something failed
+        return self._lines[self._ip - 1]
+
+    def reserve(self, names: list[str]) -> None:
+        self._names = names
+        missing = len(names) - len(self._values)
+
+        if missing > 0:
+            self._values.extend([UNDEFINED] * missing)
+            self._types.extend([object] * missing)
+            self._defined_on.extend([0] * missing)
+            self._defined_in.extend([self._lines] * missing)
+
+    def run(self, program: Program) -> None:
+        # Whatever was printed before a failure still reaches the sink
+        # ahead of the error
+        try:
+            self.execute(program)
+        except errors.ScryExc as e:
+            self.locate(e, program.source)
+            raise
+        finally:
+            self.output.flush()
+
+    def locate(self, error: errors.ScryExc, source: bytes | None) -> None:
+        if error.line is None and self._ip:
+            error.line = self.line
+
+        positions.locate(error, source)
+
+    def load(self, program: Program) -> list[Handler]:
+        self.reserve(program.names)
+        self._program = program
+        self._code = program.code
+        self._lines = program.lines
+        self._ip = 0
+        self._loops.clear()
+
+        handlers = self._unchecked_handlers if program.verified else self._handlers
+        self._dispatch = handlers
+        return handlers
+
+    def execute(self, program: Program) -> None:
+        handlers = self.load(program)
+        code = self._code
+        end = len(code)
+
+        while self._ip < end:
+            op, arg = code[self._ip]
+            self._ip += 1
+            handlers[op](arg)
+
+    def run_stream(
+        self,
+        instructions: t.Iterable[tuple[Instruction, int]],
+        names: list[str],
+        chunk_size: int = STREAM_CHUNK,
+    ) -> None:
+        stream = iter(instructions)
+
+        try:
+            while True:
+                # The compiler keeps adding to names as it goes
+                chunk = Program(names=names)
+                depth = 0
+
+                # Jumps never leave their block, so chunks only end
+                # between blocks
+                for instruction, line in stream:
+                    chunk.append(instruction, line)
+
+                    if instruction.op in BLOCK_STARTS:
+                        depth += 1
+                    elif instruction.op in BLOCK_ENDS:
+                        depth -= 1
+
+                    if depth <= 0 and len(chunk) >= chunk_size:
+                        break
+
+                if not chunk:
+                    return None
+
+                self.execute(chunk.link())
+        except errors.ScryExc as e:
+            self.locate(e, None)
+            raise
+        finally:
+            self.output.flush()
+
+    def unknown_variable(self, slot: int) -> errors.ScryExc:
+        return errors.ScryExc(
+            f"Unknown variable, line {self.line} -> {self._names[slot]!r}"
+        )
+
+    def define(self, slot: int, variable_type: type, value: t.Any) -> None:
+        self._values[slot] = value
+        self._types[slot] = variable_type
+        self._defined_on[slot] = self._ip - 1
+        self._defined_in[slot] = self._lines
+
+    def undefine(self, slot: int) -> t.Any:
+        value = self._values[slot]
+        self._values[slot] = UNDEFINED
+        del self._defined[slot]
+        return value
+
+    def op_push_string(self, arg: BoundTemplate) -> None:
+        template, slots = arg
+        self._stack.append(
+            template.render_slots(slots, self._values, self.current_line)
+        )
+
+    def op_load(self, slot: int) -> None:
+        value = self._values[slot]
+
+        if value is UNDEFINED:
+            raise self.unknown_variable(slot)
+
+        self._stack.append(value)
+
+    def op_load_drop(self, slot: int) -> None:
+        if self._values[slot] is UNDEFINED:
+            raise self.unknown_variable(slot)
+
+        self._stack.append(self.undefine(slot))
+
+    def op_store(self, slot: int) -> None:
+        if not self._stack:
+            raise errors.ScryExc(f"Not enough data on the stack, line {self.line}")
+
+        if self._values[slot] is UNDEFINED:
+            raise self.unknown_variable(slot)
+
+        popped = self._stack.pop()
+        kind: type = type(popped)
+        self.define(slot, str if kind is Rope else kind, popped)
+
+    def op_store_const(self, arg: tuple[int, t.Any]) -> None:
+        slot, value = arg
+
+        if self._values[slot] is UNDEFINED:
+            raise self.unknown_variable(slot)
+
+        self.define(slot, type(value), value)
+
+    def op_pop_drop(self, _: None) -> None:
+        if not self._stack:
+            raise errors.ScryExc(f"Not enough data on the stack, line {self.line}")
+
+        self._stack.pop()
+
+    def op_drop(self, slot: int) -> None:
+        if self._values[slot] is UNDEFINED:
+            raise self.unknown_variable(slot)
+
+        self.undefine(slot)
+
+    def op_release(self, slot: int) -> None:
+        if self._values[slot] is UNDEFINED:
+            raise self.unknown_variable(slot)
+
+        self._values[slot] = None
+
+    def op_declare(self, arg: tuple[int, type]) -> None:
+        slot, variable_type = arg
+
+        if self._values[slot] is not UNDEFINED:
+            raise errors.ScryExc(
+                f"Cannot redefine, line {self.line} "
+                f"-> {self._names[slot]!r} is already defined"
+            )
+
+        self.define(slot, variable_type, None)
+        self._defined[slot] = None
+
+    def op_move(self, arg: tuple[int, str, Template, tuple[int, ...]]) -> None:
+        slot, value, template, slots = arg
+
+        if self._values[slot] is UNDEFINED:
+            raise self.unknown_variable(slot)
+
+        variable_type = self._types[slot]
+
+        if variable_type is str:
+            if not (value.startswith('"') and value.endswith('"')):
+                values.check_string_literal(value, self.line)
+
+            self._values[slot] = template.render_slots(
+                slots, self._values, self.current_line
+            )
+
+        else:
+            self._values[slot] = variable_type(value)
+
+    def quicken(self, op: OpCode, func: Operator, a: t.Any, b: t.Any) -> None:
+        special = SPECIALIZATIONS.get((type(a), type(b)))
+
+        if special is not None:
+            self._code[self._ip - 1] = Instruction(special, (op, func))
+
+    def deoptimize(self, op: OpCode) -> None:
+        # The operands no longer match what the site was specialized
+        # for, so it goes back to the generic handler
+        self._code[self._ip - 1] = Instruction(op)
+        self._dispatch[op](None)
+
+    def op_basic(self, op: OpCode, func: Operator, _: None) -> None:
+        try:
+            a = self._stack.pop()
+            b = self._stack.pop()
+        except IndexError:
+            raise errors.ScryExc(f"Not enough data on the stack, line {self.line} ")
+
+        if isinstance(a, bool) or isinstance(b, bool):
+            raise errors.ScryExc(f"Cannot perform basic ops on bools, line {self.line}")
+
+        self.quicken(op, func, a, b)
+
+        try:
+            self._stack.append(func(a, b))
+        except TypeError:
+            self._stack.append(concat(a, b))
+
+    def op_binary_int(self, arg: Specialized) -> None:
+        stack = self._stack
+
+        if len(stack) > 1 and type(stack[-1]) is int and type(stack[-2]) is int:
+            stack.append(arg[1](stack.pop(), stack.pop()))
+        else:
+            self.deoptimize(arg[0])
+
+    def op_binary_float(self, arg: Specialized) -> None:
+        stack = self._stack
+
+        if len(stack) > 1 and type(stack[-1]) is float and type(stack[-2]) is float:
+            stack.append(arg[1](stack.pop(), stack.pop()))
+        else:
+            self.deoptimize(arg[0])
+
+    def op_binary_str(self, arg: Specialized) -> None:
+        stack = self._stack
+
+        # Every operator on two strings falls back to concatenation
+        if len(stack) > 1 and type(stack[-1]) in STRINGS and type(stack[-2]) in STRINGS:
+            stack.append(concat(stack.pop(), stack.pop()))
+        else:
+            self.deoptimize(arg[0])
+
+    def pop_typed(self, kind: type, message: str) -> t.Any:
+        if not self._stack:
+            raise errors.ScryExc(f"Not enough data on the stack, line {self.line}")
+
+        value = self._stack.pop()
+
+        if type(value) is not kind:
+            raise errors.ScryExc(f"{message}, line {self.line}")
+
+        return value
+
+    def op_nothing(self, _: None) -> None:
+        return None
+
+    def op_end(self, _: None) -> None:
+        raise errors.ScryExc(f"Block was never linked, line {self.line}")
+
+    def op_if(self, target: int) -> None:
+        if not self.pop_typed(bool, "If requires a bool"):
+            self._ip = target
+
+    def op_loop(self, target: int) -> None:
+        count = self.pop_typed(int, "Loop count must be an int")
+
+        if count > 0:
+            self._loops.append([0, count])
+        else:
+            self._ip = target
+
+    def op_end_loop(self, target: int) -> None:
+        loop = self._loops[-1]
+        loop[0] += 1
+
+        if loop[0] < loop[1]:
+            self._ip = target
+        else:
+            self._loops.pop()
+
+    def op_for(self, arg: tuple[int, int]) -> None:
+        slot, target = arg
+        count = self.pop_typed(int, "Loop count must be an int")
+
+        if self._values[slot] is not UNDEFINED:
+            raise errors.ScryExc(
+                f"Cannot redefine, line {self.line} "
+                f"-> {self._names[slot]!r} is already defined"
+            )
+
+        if count > 0:
+            self._loops.append([0, count])
+            self.define(slot, int, 0)
+            self._defined[slot] = None
+        else:
+            self._ip = target
+
+    def op_end_for(self, arg: tuple[int, int]) -> None:
+        if self._values[arg[0]] is UNDEFINED:
+            raise self.unknown_variable(arg[0])
+
+        self.op_end_for_unchecked(arg)
+
+    def op_end_start(self, target: int) -> None:
+        if self.pop_typed(bool, "End of start requires a bool"):
+            self._ip = target
+
+    def op_print(self, _: None) -> None:
+        if not self._stack:
+            raise errors.ScryExc(
+                f"Failed to print, line {self.line} -> Not enough data on the stack"
+            )
+
+        self._write(self._stack.pop())
+
+    def op_print_var(self, slot: int) -> None:
+        value = self._values[slot]
+
+        if value is UNDEFINED:
+            raise errors.ScryExc(
+                f"Unknown variable, line {self.line} -> "
+                f"{self._names[slot]!r} is an unknown variable"
+            )
+
+        self._write(value)
+
+    def op_halt(self, _: None) -> None:
+        if self._stack:
+            raise errors.ScryExc(
+                f"Unhandled data on the stack, line {self.line} "
+                f"-> {len(self._stack)} items"
+            )
+
+        if self._defined:
+            lines = {
+                slot: self._defined_in[slot][self._defined_on[slot]]
+                for slot in self._defined
+            }
+            # Described like the verifier does, with their last use
+            described = liveness.undropped(self._program)
+            # The caret goes under the first of them, not the end
+            raise errors.ScryExc(
+                "Variables not dropped: %s"
+                % ", ".join(
+                    described.get(slot, f"line {line} -> {self._names[slot]!r}")
+                    for slot, line in lines.items()
+                ),
+                line=min(lines.values()),
+            )
+
+    def op_load_unchecked(self, slot: int) -> None:
+        self._stack.append(self._values[slot])
+
+    def op_load_drop_unchecked(self, slot: int) -> None:
+        self._stack.append(self.undefine(slot))
+
+    def op_store_unchecked(self, slot: int) -> None:
+        popped = self._stack.pop()
+        kind: type = type(popped)
+        self.define(slot, str if kind is Rope else kind, popped)
+
+    def op_store_const_unchecked(self, arg: tuple[int, t.Any]) -> None:
+        slot, value = arg
+        self.define(slot, type(value), value)
+
+    def op_pop_drop_unchecked(self, _: None) -> None:
+        self._stack.pop()
+
+    def op_drop_unchecked(self, slot: int) -> None:
+        self.undefine(slot)
+
+    def op_release_unchecked(self, slot: int) -> None:
+        self._values[slot] = None
+
+    def op_declare_unchecked(self, arg: tuple[int, type]) -> None:
+        slot, variable_type = arg
+        self.define(slot, variable_type, None)
+        self._defined[slot] = None
+
+    def op_basic_unchecked(self, op: OpCode, func: Operator, _: None) -> None:
+        a = self._stack.pop()
+        b = self._stack.pop()
+        self.quicken(op, func, a, b)
+
+        try:
+            self._stack.append(func(a, b))
+        except TypeError:
+            self._stack.append(concat(a, b))
+
+    def op_print_unchecked(self, _: None) -> None:
+        self._write(self._stack.pop())
+
+    def op_print_var_unchecked(self, slot: int) -> None:
+        self._write(self._values[slot])
+
+    def op_halt_unchecked(self, _: None) -> None:
+        return None
+
+    def op_if_unchecked(self, target: int) -> None:
+        if not self._stack.pop():
+            self._ip = target
+
+    def op_loop_unchecked(self, target: int) -> None:
+        count = self._stack.pop()
+
+        if count > 0:
+            self._loops.append([0, count])
+        else:
+            self._ip = target
+
+    def op_for_unchecked(self, arg: tuple[int, int]) -> None:
+        slot, target = arg
+        count = self._stack.pop()
+
+        if count > 0:
+            self._loops.append([0, count])
+            self.define(slot, int, 0)
+            self._defined[slot] = None
+        else:
+            self._ip = target
+
+    def op_end_for_unchecked(self, arg: tuple[int, int]) -> None:
+        slot, target = arg
+        loop = self._loops[-1]
+        loop[0] += 1
+
+        if loop[0] < loop[1]:
+            # The variable counts on even if the block changed it
+            self._values[slot] = loop[0]
+            self._types[slot] = int
+            self._ip = target
+        else:
+            self._loops.pop()
+            self.undefine(slot)
+
+    def op_end_start_unchecked(self, target: int) -> None:
+        if self._stack.pop():
+            self._ip = target
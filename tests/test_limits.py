@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import pytest
+
+from scry.interpreter import Interpreter
+from scry.interpreter import ScriptResult
+from scry.limits import Limits
+
+
+def run(source: str, limits: Limits, optimize: bool) -> ScriptResult:
+    interpreter = Interpreter(optimize=optimize, use_cache=False, limits=limits)
+    return interpreter.run_string(source)
+
+
+@pytest.mark.parametrize("optimize", [True, False])
+def test_folded_int_over_limit(optimize: bool) -> None:
+    source = "push int 100\npush int 2\npow\nprint\n"
+    result = run(source, Limits(max_int_bits=64), optimize)
+
+    assert result.output == ""
+    assert result.error is not None
+    assert result.error.startswith("Integer limit exceeded, line 3")
+
+
+@pytest.mark.parametrize("optimize", [True, False])
+def test_folded_string_over_limit(optimize: bool) -> None:
+    source = 'push int 4000\npush string "x"\nmul\nprint\n'
+    result = run(source, Limits(max_string_length=10), optimize)
+
+    assert result.output == ""
+    assert result.error is not None
+    assert result.error.startswith("String limit exceeded, line 3")
+
+
+@pytest.mark.parametrize("optimize", [True, False])
+def test_folded_store_over_limit(optimize: bool) -> None:
+    source = "var int x\npush int 100\npush int 2\npow\npop x\ndrop x\n"
+    result = run(source, Limits(max_int_bits=64), optimize)
+
+    assert result.error is not None
+    assert result.error.startswith("Integer limit exceeded")
+
+
+@pytest.mark.parametrize("optimize", [True, False])
+def test_folded_within_limit(optimize: bool) -> None:
+    source = (
+        "push int 10\npush int 2\npow\nprint\n"
+        'push int 5\npush string "ab"\nmul\nprint\n'
+    )
+    result = run(source, Limits(max_int_bits=64, max_string_length=10), optimize)
+
+    assert result.error is None
+    assert result.output == "1024\nababababab\n"
+
+
+@pytest.mark.parametrize("optimize", [True, False])
+@pytest.mark.parametrize(
+    "setup, bits",
+    [
+        # 2 ** 63 and 2 ** 64
+        ("push e\npush int 2\npow", 64),
+        ("push int 1\npush e\nadd\npush int 2\npow", 65),
+        # (2 ** 32 - 1) * 2 ** 32 and 2 ** 32 * 2 ** 32
+        ("push int 4294967295\npush int 4294967296\nmul", 64),
+        ("push int 4294967296\npush int 4294967296\nmul", 65),
+        # 2 ** 63 + (2 ** 63 - 1) and 2 ** 63 + 2 ** 63
+        ("push int 9223372036854775807\npush int 9223372036854775808\nadd", 64),
+        ("push int 9223372036854775808\npush int 9223372036854775808\nadd", 65),
+        ("push int 18446744073709551615\npush int 1\nsub", 64),
+    ],
+)
+def test_int_bits_at_limit(setup: str, bits: int, optimize: bool) -> None:
+    # The exponent is moved into a variable so the optimizer can not
+    # fold the result
+    source = f"var int e\nmove e 63\n{setup}\nprint\ndrop e\n"
+    result = run(source, Limits(max_int_bits=64), optimize)
+
+    if bits <= 64:
+        assert result.error is None
+        assert int(result.output).bit_length() == bits
+    else:
+        assert result.error is not None
+        assert result.error.startswith("Integer limit exceeded")
+        assert result.output == ""
+
+
+@pytest.mark.parametrize("optimize", [True, False])
+@pytest.mark.parametrize(
+    "setup, length",
+    [
+        ('move s "aaaaaaaaa"\npush string "b"\npush s\nadd', 10),
+        ('move s "aaaaaaaaaa"\npush string "b"\npush s\nadd', 11),
+        ('move s "ab"\npush s\npush int 5\nmul', 10),
+        ('move s "ab"\npush s\npush int 6\nmul', 12),
+        ('move s "aaaaaaaaa"\npush string "${s}b"', 10),
+        ('move s "aaaaaaaaaa"\npush string "${s}b"', 11),
+    ],
+)
+def test_string_length_at_limit(setup: str, length: int, optimize: bool) -> None:
+    source = f"var string s\n{setup}\nprint\ndrop s\n"
+    result = run(source, Limits(max_string_length=10), optimize)
+
+    if length <= 10:
+        assert result.error is None
+        assert len(result.output) == length + 1
+    else:
+        assert result.error is not None
+        assert result.error.startswith("String limit exceeded")
+        assert result.output == ""